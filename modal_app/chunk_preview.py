@@ -17,8 +17,13 @@ img = (
     .apt_install("ffmpeg")
     .pip_install("requests", "supabase", "fastapi", "starlette", "librosa", "audalign", "numpy", "scipy")
     .add_local_dir(Path(__file__).parent, remote_path="/root/modal_app")
+    # HTTP/Supabase/download helpers shared with media_analyzer (importable from /root)
+    .add_local_file(Path(__file__).parent / "media_io.py", remote_path="/root/media_io.py")
 )
 
+with img.imports():
+    from media_io import download_all, extract_match_offset, supabase_client
+
 BUCKET = "vannilli"
 
 
@@ -64,11 +69,10 @@ def generate_chunk_previews(
         }
     """
     import requests
-    from supabase import create_client
     
     supabase_url = os.environ.get("SUPABASE_URL", "").rstrip("/")
     supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-    supabase = create_client(supabase_url, supabase_key)
+    supabase = supabase_client(supabase_url, supabase_key)
     
     with tempfile.TemporaryDirectory() as work_dir:
         work_path = Path(work_dir)
@@ -77,17 +81,10 @@ def generate_chunk_previews(
         video_path = work_path / "video.mp4"
         audio_path = work_path / "audio.wav"
         
-        # Download files
+        # Download files (concurrently)
         print(f"[chunk-preview] Downloading video from {video_url}")
-        r = requests.get(video_url, timeout=120)
-        r.raise_for_status()
-        video_raw_path.write_bytes(r.content)
-        
         print(f"[chunk-preview] Downloading audio from {audio_url}")
-        r = requests.get(audio_url, timeout=120)
-        r.raise_for_status()
-        audio_content = r.content
-        audio_raw_path.write_bytes(audio_content)
+        download_all([(video_url, video_raw_path), (audio_url, audio_raw_path)])
         
         # Convert audio to WAV if needed (MP3, MP4, or other formats)
         audio_ext = audio_url.lower().split('.')[-1] if '.' in audio_url.lower() else ''
@@ -96,7 +93,7 @@ def generate_chunk_previews(
             print(f"[chunk-preview] Converting audio from {audio_ext.upper()} to WAV format...")
             audio_wav_path = work_path / "audio_extracted.wav"
             subprocess.run(
-                ["ffmpeg", "-y", "-i", str(audio_raw_path), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_wav_path)],
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(audio_raw_path), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_wav_path)],
                 check=True, capture_output=True
             )
             audio_raw_path = audio_wav_path
@@ -134,7 +131,7 @@ def generate_chunk_previews(
             # IMPORTANT: Use proper encoding settings to preserve quality and fix timestamps
             video_trimmed_path = work_path / "video_trimmed.mp4"
             trim_result = subprocess.run(
-                ["ffmpeg", "-y", "-ss", str(sync_offset), "-i", str(video_raw_path),
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-ss", str(sync_offset), "-i", str(video_raw_path),
                  "-c:v", "libx264", "-preset", "fast", "-crf", "23",  # Re-encode for frame-accurate trim
                  "-pix_fmt", "yuv420p",  # Ensure compatibility
                  "-avoid_negative_ts", "make_zero",  # Ensure timestamps start at 0
@@ -165,7 +162,7 @@ def generate_chunk_previews(
             print(f"[chunk-preview] Negative offset: Trimming AUDIO by {trim_val:.3f}s (matching mid-song)")
             audio_trimmed_path = work_path / "audio_trimmed.wav"
             subprocess.run(
-                ["ffmpeg", "-y", "-ss", str(trim_val), "-i", str(audio_raw_path),
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-ss", str(trim_val), "-i", str(audio_raw_path),
                  "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le",
                  str(audio_trimmed_path)],
                 check=True, capture_output=True
@@ -233,7 +230,7 @@ def generate_chunk_previews(
                 # Chunk 0 video was already trimmed, extract from 0 with re-encoding
                 print(f"[chunk-preview] Extracting chunk 0 video (from trimmed video, re-encoding for quality)")
                 subprocess.run(
-                    ["ffmpeg", "-y", "-i", str(video_path), "-ss", "0", 
+                    ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(video_path), "-ss", "0", 
                      "-t", str(video_chunk_actual_duration),
                      "-c:v", "libx264", "-preset", "fast", "-crf", "23",  # Re-encode for quality
                      "-pix_fmt", "yuv420p",  # Ensure compatibility
@@ -247,7 +244,7 @@ def generate_chunk_previews(
                 # Re-encode to ensure quality and proper timestamps
                 print(f"[chunk-preview] Extracting chunk {i+1} video (re-encoding for quality)")
                 subprocess.run(
-                    ["ffmpeg", "-y", "-i", str(video_path), "-ss", str(video_start_time), 
+                    ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(video_path), "-ss", str(video_start_time), 
                      "-t", str(video_end_time - video_start_time),
                      "-c:v", "libx264", "-preset", "fast", "-crf", "23",  # Re-encode for quality
                      "-pix_fmt", "yuv420p",  # Ensure compatibility
@@ -279,14 +276,15 @@ def generate_chunk_previews(
             if i == 0 and sync_offset and sync_offset < 0:
                 # Chunk 0 audio was already trimmed, just extract from 0
                 subprocess.run(
-                    ["ffmpeg", "-y", "-i", str(audio_path), "-ss", "0", 
+                    ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(audio_path), 
                      "-t", str(video_chunk_actual_duration), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_chunk_path)],
                     check=True, capture_output=True
                 )
             else:
                 # Normal extraction for chunk 0 (positive/zero offset) or chunk 1+
+                # (-ss before -i: seek the input instead of decoding up to audio_start_time)
                 subprocess.run(
-                    ["ffmpeg", "-y", "-i", str(audio_path), "-ss", str(audio_start_time), 
+                    ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-ss", str(audio_start_time), "-i", str(audio_path), 
                      "-t", str(video_chunk_actual_duration), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_chunk_path)],
                     check=True, capture_output=True
                 )
@@ -297,76 +295,76 @@ def generate_chunk_previews(
             # Use unique path to avoid conflicts, but if it still exists, try update
             video_storage_path = f"{storage_prefix}/video_chunk_{i:03d}.mp4"
             print(f"[chunk-preview] Uploading video chunk {i+1} to: {video_storage_path}")
-            with open(video_chunk_path, "rb") as f:
-                video_data = f.read()
-                try:
-                    supabase.storage.from_(BUCKET).upload(
-                        video_storage_path, 
-                        video_data, 
-                        file_options={"content-type": "video/mp4"}
-                    )
-                except Exception as upload_error:
-                    # Check if it's a duplicate error (409)
-                    error_str = str(upload_error)
-                    if "409" in error_str or "Duplicate" in error_str or "already exists" in error_str:
-                        # File exists, try to update it
+            # Pass the path: the SDK opens and streams the file on each attempt (no in-memory copy)
+            video_data = video_chunk_path
+            try:
+                supabase.storage.from_(BUCKET).upload(
+                    video_storage_path, 
+                    video_data, 
+                    file_options={"content-type": "video/mp4"}
+                )
+            except Exception as upload_error:
+                # Check if it's a duplicate error (409)
+                error_str = str(upload_error)
+                if "409" in error_str or "Duplicate" in error_str or "already exists" in error_str:
+                    # File exists, try to update it
+                    try:
+                        supabase.storage.from_(BUCKET).update(
+                            video_storage_path,
+                            video_data,
+                            file_options={"content-type": "video/mp4"}
+                        )
+                    except Exception as update_error:
+                        print(f"[chunk-preview] Warning: Could not update video chunk {i+1}, trying to continue: {update_error}")
+                        # Try to delete and re-upload
                         try:
-                            supabase.storage.from_(BUCKET).update(
+                            supabase.storage.from_(BUCKET).remove([video_storage_path])
+                            supabase.storage.from_(BUCKET).upload(
                                 video_storage_path,
                                 video_data,
                                 file_options={"content-type": "video/mp4"}
                             )
-                        except Exception as update_error:
-                            print(f"[chunk-preview] Warning: Could not update video chunk {i+1}, trying to continue: {update_error}")
-                            # Try to delete and re-upload
-                            try:
-                                supabase.storage.from_(BUCKET).remove([video_storage_path])
-                                supabase.storage.from_(BUCKET).upload(
-                                    video_storage_path,
-                                    video_data,
-                                    file_options={"content-type": "video/mp4"}
-                                )
-                            except Exception:
-                                raise upload_error
-                    else:
-                        raise upload_error
+                        except Exception:
+                            raise upload_error
+                else:
+                    raise upload_error
             
             # Upload audio chunk
             audio_storage_path = f"{storage_prefix}/audio_chunk_{i:03d}.wav"
             print(f"[chunk-preview] Uploading audio chunk {i+1} to: {audio_storage_path}")
-            with open(audio_chunk_path, "rb") as f:
-                audio_data = f.read()
-                try:
-                    supabase.storage.from_(BUCKET).upload(
-                        audio_storage_path,
-                        audio_data,
-                        file_options={"content-type": "audio/wav"}
-                    )
-                except Exception as upload_error:
-                    # Check if it's a duplicate error (409)
-                    error_str = str(upload_error)
-                    if "409" in error_str or "Duplicate" in error_str or "already exists" in error_str:
-                        # File exists, try to update it
+            # Pass the path: the SDK opens and streams the file on each attempt (no in-memory copy)
+            audio_data = audio_chunk_path
+            try:
+                supabase.storage.from_(BUCKET).upload(
+                    audio_storage_path,
+                    audio_data,
+                    file_options={"content-type": "audio/wav"}
+                )
+            except Exception as upload_error:
+                # Check if it's a duplicate error (409)
+                error_str = str(upload_error)
+                if "409" in error_str or "Duplicate" in error_str or "already exists" in error_str:
+                    # File exists, try to update it
+                    try:
+                        supabase.storage.from_(BUCKET).update(
+                            audio_storage_path,
+                            audio_data,
+                            file_options={"content-type": "audio/wav"}
+                        )
+                    except Exception as update_error:
+                        print(f"[chunk-preview] Warning: Could not update audio chunk {i+1}, trying to continue: {update_error}")
+                        # Try to delete and re-upload
                         try:
-                            supabase.storage.from_(BUCKET).update(
+                            supabase.storage.from_(BUCKET).remove([audio_storage_path])
+                            supabase.storage.from_(BUCKET).upload(
                                 audio_storage_path,
                                 audio_data,
                                 file_options={"content-type": "audio/wav"}
                             )
-                        except Exception as update_error:
-                            print(f"[chunk-preview] Warning: Could not update audio chunk {i+1}, trying to continue: {update_error}")
-                            # Try to delete and re-upload
-                            try:
-                                supabase.storage.from_(BUCKET).remove([audio_storage_path])
-                                supabase.storage.from_(BUCKET).upload(
-                                    audio_storage_path,
-                                    audio_data,
-                                    file_options={"content-type": "audio/wav"}
-                                )
-                            except Exception:
-                                raise upload_error
-                    else:
-                        raise upload_error
+                        except Exception:
+                            raise upload_error
+                else:
+                    raise upload_error
             
             # Get signed URLs (valid for 1 hour)
             video_signed = supabase.storage.from_(BUCKET).create_signed_url(video_storage_path, 3600)
@@ -524,19 +522,12 @@ def api():
                 audio_path = base / "audio.wav"
                 video_audio_path = base / "video_audio.wav"
                 
-                # Download files
-                r = requests.get(video_url, timeout=120)
-                r.raise_for_status()
-                video_path.write_bytes(r.content)
-                
-                r = requests.get(audio_url, timeout=120)
-                r.raise_for_status()
-                audio_content = r.content
-                audio_path.write_bytes(audio_content)
+                # Download files (concurrently)
+                download_all([(video_url, video_path), (audio_url, audio_path)])
                 
                 # Extract audio from video for alignment
                 subprocess.run(
-                    ["ffmpeg", "-y", "-i", str(video_path), "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le", str(video_audio_path)],
+                    ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(video_path), "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le", str(video_audio_path)],
                     check=True, capture_output=True
                 )
                 
@@ -594,19 +585,7 @@ def api():
                     alignment = audalign.target_align(str(video_audio_path), str(master_audio_dir))
                     
                     # Extract offset (try match_info first, then fallback)
-                    raw_audalign_offset = None
-                    if isinstance(alignment, dict) and "match_info" in alignment:
-                        match_info = alignment["match_info"]
-                        for target_file, target_info in match_info.items():
-                            if isinstance(target_info, dict) and "match_info" in target_info:
-                                for source_file, source_info in target_info["match_info"].items():
-                                    if isinstance(source_info, dict) and "offset_seconds" in source_info:
-                                        offsets = source_info["offset_seconds"]
-                                        if offsets and len(offsets) > 0:
-                                            raw_audalign_offset = float(offsets[0])
-                                            break
-                                if raw_audalign_offset is not None:
-                                    break
+                    raw_audalign_offset = extract_match_offset(alignment.get("match_info")) if isinstance(alignment, dict) else None
                     
                     if raw_audalign_offset is None:
                         raw_audalign_offset = alignment.get("offset", 0.0)
@@ -717,8 +696,9 @@ def api():
             )
         
         # Generate chunk previews with calculated values
+        # (.aio: await the remote call instead of blocking the event loop for the whole run)
         try:
-            result = generate_chunk_previews.remote(
+            result = await generate_chunk_previews.remote.aio(
                 video_url=video_url,
                 audio_url=audio_url,
                 sync_offset=float(sync_offset),
@@ -14,15 +14,18 @@ class JobQueueManager:
         "industry": 1,  # Lowest priority (heavy jobs)
     }
     
-    def __init__(self, db_url: str, db_key: str):
+    def __init__(self, db_url: str, db_key: str, supabase_client=None):
         """Initialize queue manager.
         
         Args:
             db_url: Supabase URL
             db_key: Supabase service role key
+            supabase_client: Existing client to reuse (skips creating a second one)
         """
-        from supabase import create_client
-        self.supabase = create_client(db_url, db_key)
+        if supabase_client is None:
+            from supabase import create_client
+            supabase_client = create_client(db_url, db_key)
+        self.supabase = supabase_client
     
     def get_concurrency_limit(self) -> int:
         """Get dynamic concurrency limit from DB config (default 3)."""
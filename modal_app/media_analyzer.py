@@ -1,19 +1,50 @@
 """Media Analyzer: Fast analysis service for sync offset and tempo-based chunking."""
+import hashlib
+import logging
 import os
+import shutil
 import subprocess
+import sys
 import tempfile
 from pathlib import Path
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import modal
 
 app = modal.App("vannilli-media-analyzer")
 
 # Image with librosa, audalign, scipy, and ffmpeg
-img = modal.Image.debian_slim().apt_install("ffmpeg").pip_install(
-    "librosa", "audalign", "numpy", "scipy", "supabase", "requests", "fastapi", "starlette"
+img = (
+    modal.Image.debian_slim()
+    .apt_install("ffmpeg")
+    .pip_install("librosa", "audalign", "numpy", "scipy", "supabase", "requests", "fastapi", "starlette")
+    # HTTP/Supabase/download helpers shared with chunk_preview (importable from /root)
+    .add_local_file(Path(__file__).parent / "media_io.py", remote_path="/root/media_io.py")
 )
 
+# Analysis results keyed by sha256(video_url|audio_url|user_bpm), shared across containers
+analysis_cache = modal.Dict.from_name("vannilli-analyzer-cache", create_if_missing=True)
+
+# Heavy imports run once per container (not per call); img.imports() skips them at deploy time.
+# audalign stays lazy inside analyze_media since it is only a comparison path.
+with img.imports():
+    import librosa
+    import numpy as np
+    from scipy import fft as sp_fft
+    from scipy import signal
+
+    from media_io import download_all, extract_match_offset, supabase_client
+
+# Lazy %-style logging: message args are only formatted when the level is enabled.
+# LOG_LEVEL=DEBUG turns on the verbose correlation/audalign traces (e.g. the full alignment dict).
+log = logging.getLogger("analyzer")
+if not log.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("[analyzer] %(message)s"))
+    log.addHandler(_handler)
+    log.propagate = False
+log.setLevel(getattr(logging, os.environ.get("LOG_LEVEL", "INFO").upper(), logging.INFO))
+
 
 def get_video_duration(video_path: Path) -> float:
     """Get video duration in seconds using ffprobe."""
@@ -33,7 +64,7 @@ def extract_audio_from_video(video_path: Path, output_path: Path):
     """Extract audio track from video file."""
     subprocess.run(
         [
-            "ffmpeg", "-y", "-i", str(video_path),
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(video_path),
             "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le",
             str(output_path)
         ],
@@ -54,7 +85,7 @@ def extract_audio_from_mp4(audio_path: Path, output_path: Path):
         # It has audio, extract it
         subprocess.run(
             [
-                "ffmpeg", "-y", "-i", str(audio_path),
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(audio_path),
                 "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le",
                 str(output_path)
             ],
@@ -62,14 +93,60 @@ def extract_audio_from_mp4(audio_path: Path, output_path: Path):
             capture_output=True,
         )
     else:
-        # No audio track, copy as-is (might be audio-only MP4)
-        subprocess.run(["cp", str(audio_path), str(output_path)], check=True)
+        # No audio track, copy as-is (might be audio-only MP4); copyfile uses sendfile on Linux,
+        # an in-kernel copy with no cp fork/exec
+        shutil.copyfile(audio_path, output_path)
+
+
+def _analysis_cache_key(video_url: str, audio_url: str, user_bpm: Optional[float]) -> str:
+    """Cache key for analyze_media: the pipeline is deterministic given its inputs."""
+    return hashlib.sha256(f"{video_url}|{audio_url}|{user_bpm}".encode("utf-8")).hexdigest()
+
+
+def _record_analysis(supabase, job_id: Optional[str], generation_id: Optional[str], result: Dict):
+    """Write analysis results to video_jobs and mark the generation at 10% (only if job_id is provided)."""
+    if not job_id:
+        return
+    try:
+        # One RTT: record_analysis (packages/database/add-record-analysis-rpc.sql) updates the job and
+        # its generation together in one transaction. Fall back to the table calls if it isn't deployed.
+        try:
+            supabase.rpc("record_analysis", {
+                "job_uuid": job_id,
+                "generation_uuid": generation_id,
+                "job_sync_offset": result["sync_offset"],
+                "job_bpm": result["bpm"],
+                "job_chunk_duration": result["chunk_duration"],
+            }).execute()
+            return
+        except Exception as e:
+            log.warning("record_analysis rpc failed, updating tables directly: %s", e)
+        
+        # Update video_jobs with analysis results
+        supabase.table("video_jobs").update({
+            "sync_offset": result["sync_offset"],
+            "bpm": result["bpm"],
+            "chunk_duration": result["chunk_duration"],
+            "analysis_status": "ANALYZED",
+            "status": "ANALYZED",
+        }).eq("id", job_id).execute()
+        
+        # Update generation progress: analysis complete (10%)
+        if generation_id:
+            supabase.table("generations").update({
+                "progress_percentage": 10,
+                "current_stage": "analyzing",
+            }).eq("id", generation_id).execute()
+    except Exception as e:
+        # If job_id doesn't exist (debug mode), continue without DB updates
+        log.warning("Job ID not found (debug mode?): %s", e)
 
 
 @app.function(
     image=img,
     secrets=[modal.Secret.from_name("vannilli-secrets")],
     timeout=600,  # 10 minutes max (cross-correlation can take time for large files)
+    cpu=2,  # 2 CPUs so the FFT correlation can run multithreaded
 )
 def analyze_media(
     job_id: Optional[str],
@@ -86,15 +163,11 @@ def analyze_media(
             "chunk_duration": float,  # seconds (never > 9.0)
         }
     """
-    import requests
-    import librosa
     import audalign
-    import numpy as np
-    from supabase import create_client
     
     supabase_url = os.environ.get("SUPABASE_URL", "").rstrip("/") + "/"
     supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-    supabase = create_client(supabase_url, supabase_key)
+    supabase = supabase_client(supabase_url, supabase_key)
     
     # Get generation_id from job and update progress (only if job_id is provided)
     generation_id = None
@@ -111,7 +184,19 @@ def analyze_media(
                 }).eq("id", generation_id).execute()
         except Exception as e:
             # If job_id doesn't exist (debug mode), continue without DB updates
-            print(f"[analyzer] Job ID not found (debug mode?): {e}")
+            log.warning("Job ID not found (debug mode?): %s", e)
+    
+    # Retries and Edge Function re-invocations re-send identical inputs; skip re-analysis on a hit
+    cache_key = _analysis_cache_key(video_url, audio_url, user_bpm)
+    try:
+        cached = analysis_cache.get(cache_key)
+    except Exception as e:
+        log.warning("Analysis cache lookup failed: %s", e)
+        cached = None
+    if cached:
+        log.info("Using cached analysis result (key %s...)", cache_key[:12])
+        _record_analysis(supabase, job_id, generation_id, cached)
+        return cached
     
     with tempfile.TemporaryDirectory() as d:
         base = Path(d)
@@ -119,23 +204,16 @@ def analyze_media(
         audio_path = base / "audio.wav"
         video_audio_path = base / "video_audio.wav"
         
-        # Download files
-        print(f"[analyzer] Downloading video from {video_url}")
-        r = requests.get(video_url, timeout=120)
-        r.raise_for_status()
-        video_path.write_bytes(r.content)
-        
-        print(f"[analyzer] Downloading audio from {audio_url}")
-        r = requests.get(audio_url, timeout=120)
-        r.raise_for_status()
-        audio_content = r.content
-        audio_path.write_bytes(audio_content)
+        # Download files (concurrently)
+        log.info("Downloading video from %s", video_url)
+        log.info("Downloading audio from %s", audio_url)
+        download_all([(video_url, video_path), (audio_url, audio_path)])
         
         # Convert audio to WAV if needed (MP3, MP4, or other formats)
         audio_ext = audio_url.lower().split('.')[-1] if '.' in audio_url.lower() else ''
         if audio_ext not in ('wav', 'wave'):
             # Convert to WAV format for processing
-            print(f"[analyzer] Converting audio from {audio_ext.upper()} to WAV format...")
+            log.info("Converting audio from %s to WAV format...", audio_ext.upper())
             audio_wav_path = base / "audio_extracted.wav"
             if audio_ext == 'mp4':
                 # Use existing MP4 extraction function
@@ -143,19 +221,19 @@ def analyze_media(
             else:
                 # For MP3 and other formats, use ffmpeg to convert
                 subprocess.run(
-                    ["ffmpeg", "-y", "-i", str(audio_path), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_wav_path)],
+                    ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(audio_path), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_wav_path)],
                     check=True, capture_output=True
                 )
             audio_path = audio_wav_path
-            print(f"[analyzer] Audio converted to WAV successfully")
+            log.info("Audio converted to WAV successfully")
         
         # Extract audio from video for alignment
-        print("[analyzer] Extracting audio from video...")
+        log.info("Extracting audio from video...")
         extract_audio_from_video(video_path, video_audio_path)
         
         # 1. Calculate sync offset using manual cross-correlation (primary method)
         # This gives us full control and understanding of the calculation
-        print("[analyzer] Calculating sync offset using cross-correlation...")
+        log.info("Calculating sync offset using cross-correlation...")
         
         def calculate_sync_offset_manual(master_audio_path, video_audio_path):
             """Manually calculate sync offset using cross-correlation.
@@ -163,12 +241,11 @@ def analyze_media(
             Returns:
                 sync_offset: Positive means music starts LATER in video (dead space at start)
                             This is when music starts in video relative to master audio at 0s
+                norm_corr: Correlation strength (1.0 = perfect match)
+                y_video, sr_video: Decoded video audio, reused by the onset fallback
             """
-            import numpy as np
-            from scipy import signal
-            
             # Load both audio files at same sample rate
-            print("[analyzer] Loading audio files for cross-correlation...")
+            log.debug("Loading audio files for cross-correlation...")
             y_master, sr_master = librosa.load(str(master_audio_path), sr=22050)
             y_video, sr_video = librosa.load(str(video_audio_path), sr=22050)
             
@@ -182,15 +259,17 @@ def analyze_media(
             y_master_short = y_master[:max_corr_length]
             y_video_short = y_video[:max_corr_length]
             
-            print(f"[analyzer] Computing cross-correlation (video, master) - reverse order...")
-            print(f"[analyzer]   → Master: {len(y_master_short)/sr_master:.2f}s, Video: {len(y_video_short)/sr_video:.2f}s")
+            log.debug("Computing cross-correlation (video, master) - reverse order...")
+            log.debug("  → Master: %.2fs, Video: %.2fs", len(y_master_short)/sr_master, len(y_video_short)/sr_video)
             
             # Compute cross-correlation in REVERSE order: (video, master)
             # This finds where master audio best matches video audio
             # By correlating (video, master), positive offset should mean video has dead space
-            print(f"[analyzer] Starting cross-correlation computation (video, master)...")
-            correlation = signal.correlate(y_video_short, y_master_short, mode='full')
-            print(f"[analyzer] Cross-correlation completed, finding peak...")
+            log.debug("Starting cross-correlation computation (video, master)...")
+            # FFT method pads to a fast composite length (next_fast_len); set_workers(-1) threads pocketfft across all cores
+            with sp_fft.set_workers(-1):
+                correlation = signal.correlate(y_video_short, y_master_short, mode='full', method='fft')
+            log.debug("Cross-correlation completed, finding peak...")
             
             # Find peak correlation (best match point)
             peak_index = np.argmax(np.abs(correlation))
@@ -203,8 +282,8 @@ def analyze_media(
             offset_samples = peak_index - center_index
             offset_seconds = offset_samples / sr_master
             
-            print(f"[analyzer] Cross-correlation peak at index {peak_index} (center={center_index})")
-            print(f"[analyzer] Raw offset: {offset_samples} samples = {offset_seconds:.3f}s")
+            log.debug("Cross-correlation peak at index %s (center=%s)", peak_index, center_index)
+            log.debug("Raw offset: %s samples = %.3fs", offset_samples, offset_seconds)
             
             # Interpret offset when correlating (video, master):
             # Positive offset_samples means master audio is shifted RIGHT relative to video
@@ -213,32 +292,31 @@ def analyze_media(
             # Therefore: sync_offset = offset_seconds (positive = music starts later in video)
             
             sync_offset = offset_seconds
-            print(f"[analyzer] Interpreted sync_offset: {sync_offset:.3f}s")
+            log.info("Interpreted sync_offset: %.3fs", sync_offset)
             if sync_offset > 0:
-                print(f"[analyzer]   → Music starts {sync_offset:.3f}s INTO the video (dead space at start)")
+                log.debug("  → Music starts %.3fs INTO the video (dead space at start)", sync_offset)
             elif sync_offset < 0:
-                print(f"[analyzer]   → Negative offset detected: {sync_offset:.3f}s")
-                print(f"[analyzer]   → This might mean video starts before master, or sign needs adjustment")
+                log.debug("  → Negative offset detected: %.3fs", sync_offset)
+                log.debug("  → This might mean video starts before master, or sign needs adjustment")
             
             # Also compute correlation strength for confidence
             max_corr_value = correlation[peak_index]
             norm_corr = max_corr_value / (np.linalg.norm(y_master_short) * np.linalg.norm(y_video_short))
-            print(f"[analyzer] Correlation strength: {norm_corr:.4f} (1.0 = perfect match)")
+            log.info("Correlation strength: %.4f (1.0 = perfect match)", norm_corr)
             
-            return sync_offset, norm_corr
+            return sync_offset, norm_corr, y_video, sr_video
         
         # Calculate manual offset
-        manual_sync_offset, correlation_strength = calculate_sync_offset_manual(audio_path, video_audio_path)
-        print(f"[analyzer] Manual sync offset (cross-correlation): {manual_sync_offset:.3f}s")
+        manual_sync_offset, correlation_strength, y_video, sr_video = calculate_sync_offset_manual(audio_path, video_audio_path)
+        log.info("Manual sync offset (cross-correlation): %.3fs", manual_sync_offset)
         
         # 2. Also get audalign result for comparison
         # IMPORTANT: Video audio is the TARGET (reference point)
         # We want to find when music starts in the video (dead space at start)
         # Master audio will be aligned to match the video audio
-        print("[analyzer] Calculating sync offset with audalign for comparison...")
+        log.info("Calculating sync offset with audalign for comparison...")
         master_audio_dir = base / "master_audio_dir"
         master_audio_dir.mkdir(exist_ok=True)
-        import shutil
         master_audio_in_dir = master_audio_dir / "master_audio.wav"
         shutil.copy2(str(audio_path), str(master_audio_in_dir))
         
@@ -252,8 +330,8 @@ def analyze_media(
             )
             
             # Debug: Print full alignment result to understand structure
-            print(f"[analyzer] Audalign full alignment result: {alignment}")
-            print(f"[analyzer] Audalign alignment keys: {list(alignment.keys()) if isinstance(alignment, dict) else 'not a dict'}")
+            log.debug("Audalign full alignment result: %s", alignment)
+            log.debug("Audalign alignment keys: %s", list(alignment.keys()) if isinstance(alignment, dict) else 'not a dict')
             
             # audalign.target_align() structure:
             # - First arg (video audio) is the TARGET (reference point)
@@ -268,28 +346,14 @@ def analyze_media(
             # Structure: match_info[target_file][match_info][source_file][offset_seconds]
             # Target = video_audio.wav, Source = master_audio.wav
             audalign_sync_offset = None
-            if isinstance(alignment, dict) and "match_info" in alignment:
-                match_info = alignment["match_info"]
-                # Look for offset_seconds in match_info
-                # Target file (video audio) will have match_info for source files (master audio)
-                for target_file, target_info in match_info.items():
-                    if isinstance(target_info, dict) and "match_info" in target_info:
-                        # Source files (master audio) are in target_info["match_info"]
-                        for source_file, source_info in target_info["match_info"].items():
-                            if isinstance(source_info, dict) and "offset_seconds" in source_info:
-                                offsets = source_info["offset_seconds"]
-                                if offsets and len(offsets) > 0:
-                                    # Use first offset (most confident match)
-                                    # This is when master audio matches video audio at 0s
-                                    raw_offset = float(offsets[0])
-                                    # audalign appears to return doubled offset, divide by 2
-                                    audalign_sync_offset = raw_offset / 2.0
-                                    print(f"[analyzer] Extracted offset from match_info: {raw_offset:.3f}s (raw) → {audalign_sync_offset:.3f}s (divided by 2)")
-                                    print(f"[analyzer]   → Master audio at {audalign_sync_offset:.3f}s matches video audio at 0s")
-                                    print(f"[analyzer]   → Music starts {audalign_sync_offset:.3f}s into video (dead space at start)")
-                                    break
-                        if audalign_sync_offset is not None:
-                            break
+            raw_offset = extract_match_offset(alignment.get("match_info")) if isinstance(alignment, dict) else None
+            if raw_offset is not None:
+                # First offset is the most confident match: master audio at this time matches video audio at 0s
+                # audalign appears to return doubled offset, divide by 2
+                audalign_sync_offset = raw_offset / 2.0
+                log.info("Extracted offset from match_info: %.3fs (raw) → %.3fs (divided by 2)", raw_offset, audalign_sync_offset)
+                log.debug("  → Master audio at %.3fs matches video audio at 0s", audalign_sync_offset)
+                log.debug("  → Music starts %.3fs into video (dead space at start)", audalign_sync_offset)
             
             # Fallback to top-level offset if match_info extraction failed
             if audalign_sync_offset is None:
@@ -308,7 +372,7 @@ def analyze_media(
                         raw_offset = float(raw_offset)
                     # audalign appears to return doubled offset, divide by 2
                     audalign_sync_offset = raw_offset / 2.0
-                    print(f"[analyzer] Extracted offset from top-level key '{master_audio_key}': {raw_offset:.3f}s (raw) → {audalign_sync_offset:.3f}s (divided by 2)")
+                    log.info("Extracted offset from top-level key '%s': %.3fs (raw) → %.3fs (divided by 2)", master_audio_key, raw_offset, audalign_sync_offset)
                 else:
                     # Last resort: try "offset" key
                     raw_offset = alignment.get("offset", 0.0)
@@ -316,15 +380,15 @@ def analyze_media(
                         raw_offset = float(raw_offset)
                     # audalign appears to return doubled offset, divide by 2
                     audalign_sync_offset = raw_offset / 2.0
-                    print(f"[analyzer] Using fallback offset key: {raw_offset:.3f}s (raw) → {audalign_sync_offset:.3f}s (divided by 2)")
+                    log.info("Using fallback offset key: %.3fs (raw) → %.3fs (divided by 2)", raw_offset, audalign_sync_offset)
             
-            print(f"[analyzer] Audalign sync offset (final): {audalign_sync_offset:.3f}s")
-            print(f"[analyzer] Manual vs Audalign: {manual_sync_offset:.3f}s vs {audalign_sync_offset:.3f}s (diff: {abs(manual_sync_offset - audalign_sync_offset):.3f}s)")
+            log.info("Audalign sync offset (final): %.3fs", audalign_sync_offset)
+            log.info("Manual vs Audalign: %.3fs vs %.3fs (diff: %.3fs)", manual_sync_offset, audalign_sync_offset, abs(manual_sync_offset - audalign_sync_offset))
             if abs(manual_sync_offset) > 0.01 and abs(audalign_sync_offset) > 0.01:
                 ratio = manual_sync_offset / audalign_sync_offset
-                print(f"[analyzer] Ratio (manual/audalign): {ratio:.2f}x")
+                log.info("Ratio (manual/audalign): %.2fx", ratio)
         except Exception as e:
-            print(f"[analyzer] Audalign failed: {e}, using manual calculation only")
+            log.warning("Audalign failed: %s, using manual calculation only", e)
             audalign_sync_offset = None
         
         # Use manual calculation as primary (we understand and control it)
@@ -334,59 +398,59 @@ def analyze_media(
         # Onset-based fallback: If manual calculation returns near-zero offset, detect first musical transient
         # This handles cases where cross-correlation fails to detect dead space at video start
         if abs(sync_offset) < 0.1:
-            print(f"[analyzer] Manual calculation returned near-zero offset ({sync_offset:.3f}s), checking for onset-based fallback...")
+            log.info("Manual calculation returned near-zero offset (%.3fs), checking for onset-based fallback...", sync_offset)
             try:
-                # Load video audio and detect onsets
-                y_video, sr_video = librosa.load(str(video_audio_path), sr=22050)
-                onset_env = librosa.onset.onset_strength(y=y_video, sr=sr_video)
+                # Detect onsets on the video audio already decoded for correlation.
+                # Only the FIRST onset matters, so the first 10s is enough.
+                onset_env = librosa.onset.onset_strength(y=y_video[:int(10 * sr_video)], sr=sr_video)
                 onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=sr_video, backtrack=True)
                 
                 if len(onset_frames) > 0:
                     first_onset_time = librosa.frames_to_time(onset_frames[0], sr=sr_video)
-                    print(f"[analyzer] First onset detected at {first_onset_time:.3f}s in video audio")
+                    log.info("First onset detected at %.3fs in video audio", first_onset_time)
                     
                     # If first onset is > 0.3s, use it as offset (music starts later in video)
                     if first_onset_time > 0.3:
-                        print(f"[analyzer] Using onset-based offset: {first_onset_time:.3f}s (music starts {first_onset_time:.3f}s into video)")
+                        log.info("Using onset-based offset: %.3fs (music starts %.3fs into video)", first_onset_time, first_onset_time)
                         sync_offset = first_onset_time
-                        print(f"[analyzer] Onset offset ({first_onset_time:.3f}s) vs audalign offset ({raw_sync_offset:.3f}s) - ratio: {first_onset_time / raw_sync_offset if raw_sync_offset > 0 else 'N/A'}")
+                        log.info("Onset offset (%.3fs) vs audalign offset (%.3fs) - ratio: %s", first_onset_time, raw_sync_offset, first_onset_time / raw_sync_offset if raw_sync_offset > 0 else 'N/A')
                     else:
-                        print(f"[analyzer] First onset is too early ({first_onset_time:.3f}s), keeping audalign offset")
+                        log.info("First onset is too early (%.3fs), keeping audalign offset", first_onset_time)
                 else:
-                    print(f"[analyzer] No onsets detected in video audio, keeping audalign offset")
+                    log.info("No onsets detected in video audio, keeping audalign offset")
             except Exception as e:
-                print(f"[analyzer] Onset detection failed: {e}, keeping audalign offset")
+                log.warning("Onset detection failed: %s, keeping audalign offset", e)
         
         # Interpret offset:
         # Positive offset = master audio starts BEFORE video audio (music in video starts later)
         # This means: music starts X seconds INTO the video (dead space at start)
         # Negative offset = master audio starts AFTER video audio (video matches mid-song)
-        print(f"[analyzer] Final sync offset: {sync_offset:.3f}s")
+        log.info("Final sync offset: %.3fs", sync_offset)
         if sync_offset > 0:
-            print(f"[analyzer]   → Music starts {sync_offset:.3f}s INTO the video (dead space at start)")
-            print(f"[analyzer]   → When muxing: delay audio by {sync_offset:.3f}s to align with music start")
+            log.debug("  → Music starts %.3fs INTO the video (dead space at start)", sync_offset)
+            log.debug("  → When muxing: delay audio by %.3fs to align with music start", sync_offset)
         elif sync_offset < 0:
-            print(f"[analyzer]   → Video matches mid-song (audio needs trimming by {abs(sync_offset):.3f}s)")
+            log.debug("  → Video matches mid-song (audio needs trimming by %.3fs)", abs(sync_offset))
         else:
-            print(f"[analyzer]   → Perfect sync (no offset needed)")
+            log.debug("  → Perfect sync (no offset needed)")
         
         # 2. Calculate BPM and measure grid
         # Use user-provided BPM if available, otherwise calculate with librosa
         if user_bpm is not None and user_bpm > 0:
-            print(f"[analyzer] Using user-provided BPM: {user_bpm:.2f}")
+            log.info("Using user-provided BPM: %.2f", user_bpm)
             bpm = float(user_bpm)
             # Still calculate with librosa for comparison
             y, sr = librosa.load(str(audio_path), sr=22050)
             calculated_tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
             calculated_bpm = float(calculated_tempo)
-            print(f"[analyzer] Calculated BPM (for comparison): {calculated_bpm:.2f}")
-            print(f"[analyzer] User BPM vs Calculated: {bpm:.2f} vs {calculated_bpm:.2f} (diff: {abs(bpm - calculated_bpm):.2f})")
+            log.info("Calculated BPM (for comparison): %.2f", calculated_bpm)
+            log.info("User BPM vs Calculated: %.2f vs %.2f (diff: %.2f)", bpm, calculated_bpm, abs(bpm - calculated_bpm))
         else:
-            print("[analyzer] No user BPM provided, calculating tempo with librosa...")
+            log.info("No user BPM provided, calculating tempo with librosa...")
             y, sr = librosa.load(str(audio_path), sr=22050)
             tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
             bpm = float(tempo)
-            print(f"[analyzer] Calculated BPM: {bpm:.2f}")
+            log.info("Calculated BPM: %.2f", bpm)
         
         # Calculate beats per second and seconds per beat
         beats_per_second = bpm / 60.0
@@ -411,38 +475,20 @@ def analyze_media(
         if chunk_duration < seconds_per_measure:
             chunk_duration = seconds_per_measure
         
-        print(f"[analyzer] BPM: {bpm:.2f}, Measures per chunk: {measures_per_chunk}, Chunk duration: {chunk_duration:.2f}s")
-        
-        # Update video_jobs with analysis results (only if job_id is provided)
-        if job_id:
-            try:
-                job_data = supabase.table("video_jobs").select("generation_id").eq("id", job_id).single().execute()
-                generation_id = job_data.data.get("generation_id") if job_data.data else None
-                
-                # Update video_jobs with analysis results
-                supabase.table("video_jobs").update({
-                    "sync_offset": sync_offset,
-                    "bpm": bpm,
-                    "chunk_duration": chunk_duration,
-                    "analysis_status": "ANALYZED",
-                    "status": "ANALYZED",
-                }).eq("id", job_id).execute()
-                
-                # Update generation progress: analysis complete (10%)
-                if generation_id:
-                    supabase.table("generations").update({
-                        "progress_percentage": 10,
-                        "current_stage": "analyzing",
-                    }).eq("id", generation_id).execute()
-            except Exception as e:
-                # If job_id doesn't exist (debug mode), continue without DB updates
-                print(f"[analyzer] Job ID not found (debug mode?): {e}")
+        log.info("BPM: %.2f, Measures per chunk: %s, Chunk duration: %.2fs", bpm, measures_per_chunk, chunk_duration)
         
-        return {
+        result = {
             "sync_offset": sync_offset,
             "bpm": bpm,
             "chunk_duration": chunk_duration,
         }
+        try:
+            analysis_cache[cache_key] = result
+        except Exception as e:
+            log.warning("Failed to cache analysis result: %s", e)
+        
+        _record_analysis(supabase, job_id, generation_id, result)
+        return result
 
 
 @app.function(
@@ -560,15 +606,16 @@ def api():
                         {"error": "BPM must be between 1 and 300"},
                         status_code=400
                     )
-                print(f"[analyzer] Received user-provided BPM: {user_bpm:.2f}")
+                log.info("Received user-provided BPM: %.2f", user_bpm)
             except (ValueError, TypeError):
                 # BPM invalid format, will calculate it
-                print(f"[analyzer] Invalid BPM format: {data.get('bpm')}, will calculate instead")
+                log.warning("Invalid BPM format: %s, will calculate instead", data.get('bpm'))
         
         # Start analysis (async - returns immediately, analysis runs in background)
         try:
-            # Call the analysis function remotely (job_id can be None for debug)
-            result = analyze_media.remote(job_id or "debug", video_url, audio_url, user_bpm)
+            # Call the analysis function remotely (job_id can be None for debug); .aio awaits it
+            # without blocking the event loop, so concurrent webhooks aren't serialized behind it
+            result = await analyze_media.remote.aio(job_id or "debug", video_url, audio_url, user_bpm)
             return JSONResponse({
                 "status": "Analysis Complete",
                 "job_id": job_id,
@@ -576,21 +623,20 @@ def api():
             })
         except Exception as e:
             error_msg = str(e)[:500]  # Limit error message length
-            print(f"[analyzer] Error: {error_msg}")
+            log.error("Error: %s", error_msg)
             
             # Update job status to failed
             try:
-                from supabase import create_client
                 supabase_url = os.environ.get("SUPABASE_URL", "").rstrip("/") + "/"
                 supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-                supabase = create_client(supabase_url, supabase_key)
+                supabase = supabase_client(supabase_url, supabase_key)
                 supabase.table("video_jobs").update({
                     "analysis_status": "FAILED",
                     "status": "FAILED",
                     "error_message": error_msg,
                 }).eq("id", job_id).execute()
             except Exception as db_error:
-                print(f"[analyzer] Failed to update DB: {db_error}")
+                log.warning("Failed to update DB: %s", db_error)
             
             return JSONResponse(
                 {"error": error_msg, "job_id": job_id},
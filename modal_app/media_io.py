@@ -0,0 +1,72 @@
+"""Container-level I/O helpers shared by media_analyzer and chunk_preview: pooled HTTP session,
+memoized Supabase client, streamed/concurrent downloads and audalign result parsing."""
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional
+
+_session = None
+_supabase_clients = {}
+
+
+def http_session():
+    """Shared keep-alive requests.Session for this container (pooled, safe to use from worker threads)."""
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        _session = requests.Session()
+        # Retry transient connection errors / 429 / 5xx on idempotent calls
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504)),
+        )
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def supabase_client(url: str, key: str):
+    """Supabase client memoized per (url, key) so warm invocations skip client construction."""
+    client = _supabase_clients.get((url, key))
+    if client is None:
+        from supabase import create_client
+        client = _supabase_clients[(url, key)] = create_client(url, key)
+    return client
+
+
+def download_file(url: str, path: Path, timeout: int = 120):
+    """Stream url to path in 1 MiB blocks (peak memory is one block, not the whole file)."""
+    with http_session().get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True
+        with open(path, "wb") as f:
+            shutil.copyfileobj(r.raw, f, length=1 << 20)
+
+
+def download_all(jobs: List[tuple]):
+    """Download independent (url, path) pairs concurrently; wall time ~ slowest, not the sum."""
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as pool:
+        for future in [pool.submit(download_file, url, path) for url, path in jobs]:
+            future.result()
+
+
+def extract_match_offset(match_info) -> Optional[float]:
+    """Return the first offset_seconds from audalign's nested match_info, or None.
+
+    Structure: match_info[target_file]["match_info"][source_file]["offset_seconds"]
+    """
+    if not isinstance(match_info, dict):
+        return None
+    return next(
+        (
+            float(source_info["offset_seconds"][0])
+            for target_info in match_info.values()
+            if isinstance(target_info, dict) and isinstance(target_info.get("match_info"), dict)
+            for source_info in target_info["match_info"].values()
+            if isinstance(source_info, dict) and source_info.get("offset_seconds")
+        ),
+        None,
+    )
@@ -1,18 +1,57 @@
 """Modal function: 3 inputs -> 1 output. Kling (video+image) -> FFmpeg merge with audio -> watermark if trial -> Supabase. Deletes 3 inputs after."""
+import collections
+import functools
+import hmac
+import json
 import os
+import secrets
+import shutil
 import subprocess
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
-import jwt
-import requests
 from pathlib import Path
 
 import modal
 
 app = modal.App("vannilli-process-video")
-img = modal.Image.debian_slim().apt_install("ffmpeg").pip_install("requests", "supabase", "fastapi", "pyjwt", "audalign")
+# ffmpeg comes from Debian's signed apt repo rather than a smaller static build downloaded at image
+# build time: it costs ~200 MB of shared libs in the image, but builds are reproducible from a trusted
+# source and it keeps the NVENC/NVDEC support the h264_nvenc paths probe for. Stable layers first so
+# pip changes don't rebuild the apt layer.
+img = (
+    modal.Image.debian_slim()
+    .apt_install("ffmpeg", "curl")
+    # Default trial watermark baked in so trial jobs don't fetch it (optional: build never fails on it)
+    .run_commands(
+        "mkdir -p /opt/vannilli && (curl -fsSL https://vannilli.xaino.io/logo/watermark.png"
+        " -o /opt/vannilli/watermark.png || rm -f /opt/vannilli/watermark.png)"
+    )
+    .uv_pip_install("requests", "supabase", "fastapi", "pyjwt", "numpy", "av>=14", "httpx[http2]", "orjson")
+    # GCC-PHAT alignment shared with video_orchestrator (importable from /root next to this module)
+    .add_local_file(Path(__file__).parent / "audio_align.py", remote_path="/root/audio_align.py")
+)
+
+# Imported at module scope so they are captured in the memory snapshot (enable_memory_snapshot on api)
+with img.imports():
+    import av
+    import httpx
+    import jwt
+    import numpy as np
+    import orjson
+    import requests
+    from fastapi import FastAPI, Request
+    from fastapi.responses import ORJSONResponse
+    from requests.adapters import HTTPAdapter
+    from starlette.concurrency import run_in_threadpool
+    from starlette.middleware.cors import CORSMiddleware
+    from supabase import create_client
+    from urllib3.util.retry import Retry
+
+    from audio_align import ALIGN_SAMPLE_RATE, gcc_phat_offset
 
 BUCKET = "vannilli"
 INPUTS_PREFIX = "inputs"
@@ -25,18 +64,441 @@ def _cors_origins() -> list:
         return [o.strip() for o in raw.split(",") if o.strip()]
     return ["https://vannilli.xaino.io", "http://localhost:3000", "http://127.0.0.1:3000"]
 
-def _run_ffmpeg(args: list, label: str):
+# Env-derived config, parsed once per container (vannilli-secrets is injected before import, and
+# the values are captured in the memory snapshot; redeploy to pick up rotated secrets).
+def _k(v): return (v or "").strip() or None
+_CORS = _cors_origins()
+_SUPA_BASE = (os.environ.get("SUPABASE_URL") or "").strip()
+_SUPA_URL = (_SUPA_BASE.rstrip("/") + "/") if _SUPA_BASE else _SUPA_BASE
+_SUPA_KEY = (os.environ.get("SUPABASE_SERVICE_ROLE_KEY") or "").strip()  # required; checked by _supabase_env
+# fal.ai API: Use FAL_API_KEY (or KLING_API_KEY for backward compatibility)
+_FAL_KEY = _k(os.environ.get("FAL_API_KEY")) or _k(os.environ.get("KLING_API_KEY"))
+_FAL_AUTH = {"Authorization": f"Key {_FAL_KEY}"}
+_FAL_HEADERS = {"Content-Type": "application/json", **_FAL_AUTH}
+_DEFAULT_WATERMARK_URL = "https://vannilli.xaino.io/logo/watermark.png"
+_WATERMARK_URL = os.environ.get("VANNILLI_WATERMARK_URL") or _DEFAULT_WATERMARK_URL
+_BAKED_WATERMARK = Path("/opt/vannilli/watermark.png")  # fetched at image build
+# Public URL of this app's /fal-complete route. When set, fal.ai calls it when Kling finishes and
+# process_video returns right after the submit instead of waiting on the generation.
+_FAL_WEBHOOK_URL = _k(os.environ.get("VANNILLI_FAL_WEBHOOK_URL"))
+
+# fal.ai queue API: submissions go to the full endpoint, status/result lookups to the base model id
+_FAL_QUEUE_URL = "https://queue.fal.run"
+_FAL_MODEL_ID = "kling-video/v2.6"
+
+# Webhook mode: per-request state saved at submit (keyed by fal request_id), read by /fal-complete.
+# Side keys under the same id: "<id>:offset" (alignment result, written by process_video),
+# "<id>:video" (Kling output, written by the webhook), "<id>:claimed" / "<id>:finishing" (claims).
+pending_generations = modal.Dict.from_name("vannilli-pending-generations", create_if_missing=True)
+# Webhook-mode requests still unfinished after this long are resolved from fal.ai's status endpoint
+_FAL_WEBHOOK_TIMEOUT = 900
+
+_session = None
+
+def _http():
+    """Shared keep-alive requests.Session for this container (pooled, safe to use from worker threads).
+    Used for downloads (ranged downloads want separate connections) and the Kling auth check."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        # Retry transient connection errors / 429 / 5xx on idempotent calls, honouring Retry-After.
+        # POST stays excluded (urllib3 default): a replayed fal.ai submit would start a second paid job.
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)),
+        )
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+_fal = None
+
+def _fal_http():
+    """Shared HTTP/2 client for the fal.ai queue API: submit, status polls and result fetch
+    multiplex on one TLS connection with HPACK-compressed headers."""
+    global _fal
+    if _fal is None:
+        _fal = httpx.Client(
+            timeout=httpx.Timeout(30.0),
+            transport=httpx.HTTPTransport(
+                http2=True, retries=2, limits=httpx.Limits(max_keepalive_connections=8),
+            ),
+        )
+    return _fal
+
+def _warm_fal():
+    try:
+        _fal_http().head("https://queue.fal.run/", headers=_FAL_AUTH, timeout=5)
+    except Exception:
+        pass
+
+def _fal_wait_stream(url: str, deadline: float) -> bool:
+    """Follow a fal.ai queue status SSE stream until a terminal status. True when the request
+    finished (COMPLETED/FAILED); False if the stream failed, ended early or hit the deadline."""
+    try:
+        read_timeout = max(1.0, deadline - time.monotonic())
+        with _fal_http().stream("GET", url, headers=_FAL_AUTH,
+                                timeout=httpx.Timeout(30.0, read=read_timeout)) as r:
+            if r.status_code != 200:
+                print(f"[vannilli] fal.ai status stream HTTP {r.status_code}, falling back to polling")
+                return False
+            for line in r.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    status = json.loads(line[5:]).get("status")
+                except ValueError:
+                    continue
+                if status in ("COMPLETED", "FAILED"):
+                    return True
+                if time.monotonic() > deadline:
+                    return False
+    except Exception as e:
+        print(f"[vannilli] fal.ai status stream error, falling back to polling: {type(e).__name__} {e}")
+    return False
+
+@functools.lru_cache(maxsize=4)
+def _watermark_bytes(url: str) -> bytes:
+    """Watermark PNG: the copy baked into the image for the default URL, else fetched once per container."""
+    if url == _DEFAULT_WATERMARK_URL and _BAKED_WATERMARK.exists():
+        return _BAKED_WATERMARK.read_bytes()
+    r = _http().get(url, timeout=30)
+    r.raise_for_status()
+    print(f"[vannilli] Watermark downloaded from {url}")
+    return r.content
+
+def _download(u: str, p: Path):
+    # Copy socket -> file in 4 MiB blocks on an unbuffered fd: one write syscall per block,
+    # no whole-file bytes object and no extra copy through Python's 8 KiB file buffer
+    with _http().get(u, stream=True, timeout=120) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True
+        with open(p, "wb", buffering=0) as f:
+            shutil.copyfileobj(r.raw, f, length=4 << 20)
+
+def _parallel_download(u: str, p: Path, chunks: int = 4, chunksize: int = 8 << 20):
+    """Fetch u into p as concurrent HTTP Range requests written with os.pwrite.
+    Falls back to a single streamed download when the file is small or ranges are unsupported."""
+    try:
+        head = _http().head(u, allow_redirects=True, timeout=30)
+        size = int(head.headers.get("Content-Length") or 0)
+        ranges_ok = head.ok and head.headers.get("Accept-Ranges", "").lower() == "bytes"
+    except Exception:
+        size, ranges_ok = 0, False
+    if not ranges_ok or size <= chunksize:
+        _download(u, p)
+        return
+
+    part = -(-size // chunks)  # ceil division
+    spans = [(start, min(start + part, size) - 1) for start in range(0, size, part)]
+
+    def fetch(span, fd):
+        start, end = span
+        with _http().get(u, headers={"Range": f"bytes={start}-{end}"}, stream=True, timeout=120) as r:
+            r.raise_for_status()
+            if r.status_code != 206:
+                raise Exception(f"Range request ignored (HTTP {r.status_code})")
+            offset = start
+            for chunk in r.iter_content(chunk_size=1 << 20):
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+        if offset != end + 1:
+            raise Exception(f"Short range read: bytes {start}-{end}, got {offset - start}")
+
+    try:
+        fd = os.open(str(p), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            with ThreadPoolExecutor(max_workers=len(spans)) as pool:
+                for future in [pool.submit(fetch, span, fd) for span in spans]:
+                    future.result()
+        finally:
+            os.close(fd)
+    except Exception as e:
+        print(f"[vannilli] Parallel download failed ({e}), retrying as a single stream")
+        _download(u, p)
+
+def _audio_ext(url: str) -> str:
+    """Detect file extension from URL (mp3 when there is none)."""
+    return url.lower().split('.')[-1].split('?')[0] if '.' in url.lower() else 'mp3'
+
+def _supabase_env():
+    """(SUPABASE_URL with trailing slash, service role key) from vannilli-secrets. A missing key fails
+    here, at container start, rather than surfacing later as 401/403s from Supabase."""
+    if not _SUPA_KEY:
+        raise KeyError("SUPABASE_SERVICE_ROLE_KEY")
+    return _SUPA_URL, _SUPA_KEY
+
+_supabase_clients = {}
+
+def _supabase_client(url: str, key: str):
+    """Supabase client memoized per (url, key) so warm invocations skip client construction."""
+    client = _supabase_clients.get((url, key))
+    if client is None:
+        client = _supabase_clients[(url, key)] = create_client(url, key)
+    return client
+
+def _kling_jwt(access: str, secret: str):
+    """Kling JWT (iss=access key, exp=now+30min, nbf=now-5s), freshly signed on every call: it is only
+    used by the test_kling_auth credential check, which must exercise the current keys.
+    Returns (token, nbf, exp)."""
+    now = int(time.time())
+    pl = {"iss": access, "exp": now + 1800, "nbf": now - 5}
+    headers = {"alg": "HS256", "typ": "JWT"}
+    tok = jwt.encode(pl, secret, algorithm="HS256", headers=headers)
+    tok = tok.decode("utf-8") if isinstance(tok, bytes) else tok
+    return tok, pl["nbf"], pl["exp"]
+
+def _scratch_dir(min_free: int = 1 << 30) -> Optional[str]:
+    """Put intermediates on tmpfs (/dev/shm) when it has room; None = default temp dir (disk)."""
     try:
-        subprocess.run(args, check=True, capture_output=True)
+        st = os.statvfs("/dev/shm")
+        if st.f_bavail * st.f_frsize >= min_free and os.access("/dev/shm", os.W_OK):
+            return "/dev/shm"
+    except OSError:
+        pass
+    return None
+
+def _probe_video_stream(src: str) -> dict:
+    """codec_name/pix_fmt of the first video stream (src may be a path or URL); {} if ffprobe fails."""
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "stream=codec_name,pix_fmt",
+             "-of", "json", src],
+            capture_output=True, check=True, timeout=30,
+        ).stdout
+        streams = json.loads(out or b"{}").get("streams") or [{}]
+        return streams[0]
+    except Exception as e:
+        print(f"[vannilli] ffprobe failed for {src[:80]}: {e}")
+        return {}
+
+def _pcm_mono(src: Path, label: str) -> "np.ndarray":
+    """Decode src's audio to ALIGN_SAMPLE_RATE mono float32 via an ffmpeg pipe (no temp WAV)."""
+    args = ["ffmpeg", "-v", "error", "-i", str(src), "-vn", "-ac", "1", "-ar", str(ALIGN_SAMPLE_RATE),
+            "-f", "f32le", "pipe:1"]
+    try:
+        out = subprocess.run(args, check=True, capture_output=True).stdout
     except subprocess.CalledProcessError as e:
-        stderr = (e.stderr or b"").decode("utf-8", errors="replace")[:4000]
-        stdout = (e.stdout or b"").decode("utf-8", errors="replace")[:4000]
-        print(f"[vannilli] ffmpeg FAIL ({label}): rc={e.returncode} args={e.args!r}")
-        if stdout:
-            print(f"[vannilli] ffmpeg stdout ({label}): {stdout}")
+        print(f"[vannilli] ffmpeg FAIL ({label}): rc={e.returncode} stderr={(e.stderr or b'')[:2000]!r}")
+        raise
+    return np.frombuffer(out, dtype=np.float32)
+
+_nvenc = None
+
+def _has_nvenc() -> bool:
+    """True when an NVIDIA device is visible and the ffmpeg binary has h264_nvenc (checked once)."""
+    global _nvenc
+    if _nvenc is None:
+        _nvenc = False
+        if os.path.exists("/dev/nvidia0"):
+            try:
+                out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, timeout=10).stdout
+                _nvenc = b"h264_nvenc" in out
+            except Exception:
+                pass
+        print(f"[vannilli] h264_nvenc available: {_nvenc}")
+    return _nvenc
+
+def _run_ffmpeg(args: list, label: str):
+    # Errors only and no progress stats: stderr stays small, and only its tail is kept in memory
+    args = [args[0], "-hide_banner", "-loglevel", "error", "-nostats", *args[1:]]
+    proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    tail = collections.deque(maxlen=64)
+    for line in proc.stderr:
+        tail.append(line)
+    rc = proc.wait()
+    if rc != 0:
+        stderr = b"".join(tail)[-4000:].decode("utf-8", errors="replace")
+        print(f"[vannilli] ffmpeg FAIL ({label}): rc={rc} args={args!r}")
         if stderr:
             print(f"[vannilli] ffmpeg stderr ({label}): {stderr}")
-        raise
+        raise subprocess.CalledProcessError(rc, args, None, stderr)
+
+def _container_duration(src: Path) -> Optional[float]:
+    """Container duration in seconds from the header (no decode); None if unknown."""
+    try:
+        with av.open(str(src)) as c:
+            return c.duration / av.time_base if c.duration else None
+    except Exception:
+        return None
+
+def _trim_copy(src: Path, dst: Path, secs: float):
+    """Stream-copy the first `secs` seconds of src into dst with in-process libav (no fork/exec,
+    no decode/encode). Falls back to the ffmpeg CLI if PyAV can't remux the container."""
+    try:
+        with av.open(str(src)) as inp, av.open(str(dst), "w", format="mp4", options={"movflags": "+faststart"}) as out:
+            streams = {s.index: out.add_stream_from_template(s) for s in inp.streams if s.type in ("video", "audio")}
+            done = set()
+            for pkt in inp.demux([inp.streams[i] for i in streams]):
+                idx = pkt.stream.index
+                if pkt.dts is None or idx in done:
+                    continue  # flush packet / stream already past the cut
+                if pkt.pts is not None and pkt.pts * pkt.time_base >= secs:
+                    done.add(idx)
+                    if len(done) == len(streams):
+                        break
+                    continue
+                pkt.stream = streams[idx]
+                out.mux(pkt)
+    except Exception as e:
+        print(f"[vannilli] PyAV trim failed, using ffmpeg: {type(e).__name__} {e}")
+        _run_ffmpeg(
+            ["ffmpeg", "-y", "-i", str(src), "-to", str(secs), "-map", "0", "-c", "copy",
+             "-avoid_negative_ts", "make_zero", "-movflags", "+faststart", str(dst)],
+            "trim-video",
+        )
+
+
+def _finish_generation(supabase, base: Path, scratch: Optional[str], kling_video_url: str, *, generation_id: str,
+                       audio_url: Optional[str], is_trial: bool, gen_secs: float, audio_for_merge: Optional[dict],
+                       watermark_path: Optional[Path], kling_units_used=None, cleanup_async: bool = True) -> dict:
+    """Everything after Kling returns a video: merge/watermark in one ffmpeg pass, upload final.mp4,
+    mark the generation completed and clean up inputs. Used by the polling and webhook paths.
+
+    cleanup_async=False deletes the inputs before returning, for callers whose container may exit as
+    soon as they return (the finish_generation function) and would drop a background delete."""
+    kling_path = base / "kling.mp4"
+    final_path = base / "final.mp4"
+
+    if (audio_url or is_trial) and scratch is None:
+        # Output is re-encoded by ffmpeg and there's no tmpfs: let ffmpeg read Kling's URL directly
+        # (HTTP range reads) rather than writing the MP4 to disk only to read it straight back
+        kling_input = ["-reconnect", "1", "-reconnect_streamed", "1", "-i", kling_video_url]
+    else:
+        # Kling outputs are the largest file we fetch: split into concurrent byte ranges
+        _parallel_download(kling_video_url, kling_path)
+        kling_input = ["-i", str(kling_path)]
+
+    # Only watermark: VANNILLI logo, for trial users only. It is burned in by the same
+    # ffmpeg pass that muxes the audio, so the video is decoded/encoded exactly once.
+    video_map = "0:v:0"
+    watermark_input = []
+    video_filter = []
+    if is_trial:
+        if watermark_path and watermark_path.exists():
+            # Use image watermark overlay (bottom-right corner, 20px padding); it is the last input
+            wm_index = 2 if audio_for_merge else 1
+            watermark_input = ["-i", str(watermark_path)]
+            video_filter = ["-filter_complex", f"[{wm_index}:v]scale=iw*0.15:-1[wm];[0:v][wm]overlay=W-w-20:H-h-20:format=auto[vout]"]
+            video_map = "[vout]"
+        else:
+            # Fallback to text watermark if image download failed
+            video_filter = ["-vf", "drawtext=text='VANNILLI.io':x=(w-text_w)/2:y=h-50:fontsize=24:fontcolor=white@0.7"]
+    video_encode = ["-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p"]
+    if _has_nvenc():
+        # GPU attached and ffmpeg built with NVENC: hardware encode, CPU only demuxes/filters
+        video_encode = ["-c:v", "h264_nvenc", "-preset", "p4", "-tune", "ll", "-rc", "vbr", "-cq", "23",
+                        "-b:v", "5M", "-pix_fmt", "yuv420p"]
+    elif is_trial:
+        # Trial output favours turnaround over file size: ultrafast is ~3-5x less CPU than veryfast
+        video_encode = ["-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency", "-crf", "23",
+                        "-threads", "0", "-pix_fmt", "yuv420p"]
+
+    if audio_for_merge and not is_trial:
+        # Nothing touches the pixels: if Kling's stream is already H.264/yuv420p, remux it as-is
+        # and only encode the audio (O(bytes) instead of O(pixels))
+        vs = _probe_video_stream(kling_input[-1])
+        if vs.get("codec_name") == "h264" and vs.get("pix_fmt") == "yuv420p":
+            print("[vannilli] Kling output is h264/yuv420p - stream-copying video for merge")
+            video_encode = ["-c:v", "copy"]
+
+    # If audio provided, merge aligned slice with Kling video
+    if audio_for_merge and isinstance(audio_for_merge, dict):
+        print("[vannilli] Merging Kling video with aligned audio slice...")
+        try:
+            # Slice the master audio inside the merge itself (input options on the audio -i),
+            # so no separate extract process or intermediate WAV is needed
+            # Start time in master audio = 0 + offset (if offset is positive, master is ahead)
+            # For gen_secs > 0, take exactly gen_secs starting from offset; otherwise offset to end
+            start_time = max(0.0, audio_for_merge["offset"])
+            duration = audio_for_merge["duration"] if audio_for_merge["duration"] else None
+            audio_input = ["-ss", str(start_time)]
+            if duration:
+                audio_input += ["-t", str(duration)]
+            audio_input += ["-i", str(audio_for_merge["path"])]
+            
+            # Merge aligned audio (and watermark, if trial) with Kling video
+            _run_ffmpeg(
+                [
+                    "ffmpeg", "-y",
+                    *kling_input,
+                    *audio_input,
+                    *watermark_input,
+                    *video_filter,
+                    "-map", video_map,
+                    "-map", "1:a:0",
+                    *video_encode,
+                    "-c:a", "aac",
+                    "-b:a", "192k",
+                    "-movflags", "+faststart",
+                    "-shortest",
+                    str(final_path),
+                ],
+                "merge-audio",
+            )
+        except Exception as e:
+            print(f"[vannilli] Audio alignment/merge failed: {e}")
+            _fail(supabase, generation_id, "Audio/video merge failed. Please try again. If it persists, contact VANNILLI support.")
+            return {"ok": False, "error": "Audio/video merge failed. Please try again. If it persists, contact VANNILLI support."}
+    elif is_trial:
+        # No audio provided - watermark Kling video, keeping its own audio (if any) as-is
+        _run_ffmpeg(
+            [
+                "ffmpeg", "-y",
+                *kling_input,
+                *watermark_input,
+                *video_filter,
+                "-map", video_map,
+                "-map", "0:a?",
+                *video_encode,
+                "-c:a", "copy",
+                "-movflags", "+faststart",
+                str(final_path),
+            ],
+            "watermark",
+        )
+    else:
+        # No audio provided - upload Kling video as-is (it may have audio from the tracking video)
+        print("[vannilli] No audio - using Kling output as-is")
+        final_path = kling_path
+
+    out_key = f"{OUTPUTS_PREFIX}/{generation_id}/final.mp4"
+    _upload_file(supabase, out_key, final_path)
+
+    # One RTT: complete_generation (packages/database/add-complete-generation-rpc.sql) updates
+    # the generation and its project together. Fall back to the table calls if it isn't deployed.
+    try:
+        supabase.rpc("complete_generation", {"generation_uuid": generation_id, "output_path": out_key}).execute()
+    except Exception as e:
+        print(f"[vannilli] complete_generation rpc failed, updating tables directly: {e}")
+        supabase.table("generations").update({
+            "status": "completed",
+            "final_video_r2_path": out_key,
+            "completed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }).eq("id", generation_id).execute()
+
+        gr = supabase.table("generations").select("project_id").eq("id", generation_id).single().execute()
+        if gr.data and gr.data.get("project_id"):
+            supabase.table("projects").update({"status": "completed"}).eq("id", gr.data["project_id"]).execute()
+
+    # Delete input files from Storage (include tracking_trimmed.mp4 when we created it)
+    inp_prefix = f"{INPUTS_PREFIX}/{generation_id}"
+    to_remove = ["tracking.mp4", "target.jpg"]
+    if audio_url:
+        to_remove.append("audio.mp3")
+    if gen_secs > 0:
+        to_remove.append("tracking_trimmed.mp4")
+    # Storage remove takes a list: one DELETE for all inputs. The result doesn't depend on it,
+    # so on the web path it runs in the background and the response goes back to the browser right away.
+    paths = [f"{inp_prefix}/{n}" for n in to_remove]
+    if cleanup_async:
+        _remove_async(supabase, paths)
+    else:
+        _remove_inputs(supabase, paths)
+
+    return {"ok": True, "path": out_key, "kling_units_used": kling_units_used}
 
 
 def process_video_impl(data: Optional[dict] = None):
@@ -54,162 +516,96 @@ def process_video_impl(data: Optional[dict] = None):
     if not all([tracking_url, target_url, generation_id]):
         return {"ok": False, "error": "Missing required fields: tracking_video_url, target_image_url, generation_id"}
 
-    _base = (os.environ.get("SUPABASE_URL") or "").strip()
-    supabase_url = (_base.rstrip("/") + "/") if _base else _base
-    supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
-    # fal.ai API: Use FAL_API_KEY (or KLING_API_KEY for backward compatibility)
-    def _k(v): return (v or "").strip() or None
-    fal_api_key = _k(os.environ.get("FAL_API_KEY")) or _k(os.environ.get("KLING_API_KEY"))
-    if not fal_api_key:
+    if not _FAL_KEY:
         return {"ok": False, "error": "Video service is not configured. Please contact VANNILLI support."}
-    print(f"[vannilli] Using fal.ai API with FAL_API_KEY")
-    # Log that we're using service_role (do not log the key). 403 often means anon key or missing RLS.
-    print(f"[vannilli] SUPABASE_SERVICE_ROLE_KEY present: True, len={len(supabase_key)}")
 
-    from supabase import create_client
-    supabase = create_client(supabase_url, supabase_key)
+    supabase = _supabase_client(*_supabase_env())
 
-    with tempfile.TemporaryDirectory() as d:
+    # stage_pool runs work that overlaps the Kling generation; it is joined before the tempdir is removed
+    scratch = _scratch_dir()
+    with tempfile.TemporaryDirectory(dir=scratch) as d, ThreadPoolExecutor(max_workers=1) as stage_pool:
         base = Path(d)
         tracking_path = base / "tracking.mp4"
         target_path = base / "target.jpg"
         audio_raw_path = base / "audio_raw"  # Will detect extension from URL
-        audio_path = base / "audio.wav"  # Converted WAV for processing
-        kling_path = base / "kling.mp4"
-        synced_path = base / "synced.mp4"
-        final_path = base / "final.mp4"
         watermark_path = base / "watermark.png"
 
-        def download(u: str, p: Path):
-            r = requests.get(u, timeout=120)
-            r.raise_for_status()
-            p.write_bytes(r.content)
+        download = _download
 
         try:
-            download(tracking_url, tracking_path)
-            download(target_url, target_path)
+            # Inputs are independent: fetch them concurrently (wall time ~ slowest, not the sum)
+            downloads = [(tracking_url, tracking_path), (target_url, target_path)]
             if audio_url:
-                # Detect file extension from URL
-                audio_ext = audio_url.lower().split('.')[-1].split('?')[0] if '.' in audio_url.lower() else 'mp3'
+                audio_ext = _audio_ext(audio_url)
                 audio_raw_path = base / f"audio_raw.{audio_ext}"
-                download(audio_url, audio_raw_path)
-                
-                # Convert to WAV if needed (MP3, MP4, or other formats)
-                if audio_ext not in ('wav', 'wave'):
-                    print(f"[vannilli] Converting audio from {audio_ext.upper()} to WAV format...")
-                    _run_ffmpeg(
-                        ["ffmpeg", "-y", "-i", str(audio_raw_path), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_path)],
-                        "convert-audio-to-wav",
-                    )
-                    print(f"[vannilli] Audio converted to WAV successfully")
-                else:
-                    # Already WAV, just copy/rename
-                    import shutil
-                    shutil.copy2(audio_raw_path, audio_path)
-            # Download watermark if needed for trial users
+                downloads.append((audio_url, audio_raw_path))
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                for future in [pool.submit(download, u, p) for u, p in downloads]:
+                    future.result()
             if is_trial:
-                watermark_url = os.environ.get("VANNILLI_WATERMARK_URL") or "https://vannilli.xaino.io/logo/watermark.png"
+                # Watermark is baked into the image / cached per container (failure is non-fatal)
                 try:
-                    download(watermark_url, watermark_path)
-                    print(f"[vannilli] Watermark downloaded from {watermark_url}")
+                    watermark_path.write_bytes(_watermark_bytes(_WATERMARK_URL))
                 except Exception as e:
-                    print(f"[vannilli] Warning: Failed to download watermark from {watermark_url}: {e}. Using text watermark fallback.")
+                    print(f"[vannilli] Warning: Failed to download watermark from {_WATERMARK_URL}: {e}. Using text watermark fallback.")
                     watermark_path = None
         except Exception as e:
             _fail(supabase, generation_id, "Download failed. Please check your files and try again.")
             return {"ok": False, "error": "Download failed. Please check your files and try again."}
 
         tracking_url_for_kling = tracking_url
-        audio_for_merge = None
+        align_future = None
 
         # If audio is provided, do audio alignment logic
         if audio_url:
             print("[vannilli] Audio provided - performing alignment...")
-            try:
-                import audalign
-            except ImportError:
-                _fail(supabase, generation_id, "Audio alignment service unavailable. Please try again.")
-                return {"ok": False, "error": "Audio alignment service unavailable. Please try again."}
-            
-            # Extract audio from tracking video for alignment
-            tracking_audio_path = base / "tracking_audio.wav"
-            _run_ffmpeg(
-                ["ffmpeg", "-y", "-i", str(tracking_path), "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le", str(tracking_audio_path)],
-                "extract-tracking-audio",
-            )
-            
-            # Find global offset using audalign
-            alignment = audalign.target_align(
-                str(audio_path),  # master audio (target)
-                str(tracking_audio_path),  # video audio (to align)
-            )
-            global_offset = alignment.get("offset", 0.0)
-            if not isinstance(global_offset, (int, float)):
-                global_offset = float(global_offset)
-            print(f"[vannilli] Global audio offset: {global_offset}s (master is {'ahead' if global_offset > 0 else 'behind'} video)")
-            
-            # Trim tracking video if needed
-            if gen_secs > 0:
-                tracking_trimmed = base / "tracking_trimmed.mp4"
-                _run_ffmpeg(
-                    ["ffmpeg", "-y", "-i", str(tracking_path), "-t", str(gen_secs), "-c", "copy", str(tracking_trimmed)],
-                    "trim-video",
-                )
-                # Upload trimmed file for Kling
-                inp_trimmed = f"{INPUTS_PREFIX}/{generation_id}/tracking_trimmed.mp4"
-                print(f"[vannilli] Uploading trimmed video: {inp_trimmed}")
-                try:
-                    supabase.storage.from_(BUCKET).upload(inp_trimmed, tracking_trimmed.read_bytes(), file_options={"content-type": "video/mp4"})
-                    sig = supabase.storage.from_(BUCKET).create_signed_url(inp_trimmed, 3600)
-                    if isinstance(sig, tuple):
-                        sig = sig[0] if sig else {}
-                    tracking_url_for_kling = (sig.get("signedUrl") or sig.get("signed_url")) if isinstance(sig, dict) else (getattr(sig, "signedUrl", None) or getattr(sig, "signed_url", None))
-                    if not tracking_url_for_kling:
-                        tracking_url_for_kling = tracking_url
-                    print(f"[vannilli] Trimmed video uploaded OK")
-                except Exception as e:
-                    print(f"[vannilli] Trimmed video upload failed, using original: {e}")
-                    tracking_url_for_kling = tracking_url
-            else:
-                tracking_url_for_kling = tracking_url
-            
-            # Prepare aligned audio for merging (will extract after Kling completes)
-            # Store offset and audio path for later use
-            audio_for_merge = {
-                "path": audio_path,
-                "offset": global_offset,
-                "duration": gen_secs if gen_secs > 0 else None,
-            }
+
+            def _align():
+                # Find global offset: GCC-PHAT between the master and the tracking video's own audio.
+                # The master is decoded once, here; the merge reads the downloaded file directly (as the
+                # webhook finisher does), so there is no intermediate WAV conversion.
+                master = _pcm_mono(audio_raw_path, "decode-master-audio")
+                tracking_audio = _pcm_mono(tracking_path, "extract-tracking-audio")
+                global_offset = gcc_phat_offset(master, tracking_audio, ALIGN_SAMPLE_RATE)
+                print(f"[vannilli] Global audio offset: {global_offset}s (master is {'ahead' if global_offset > 0 else 'behind'} video)")
+                return global_offset
+
+            # The offset is only needed for the final merge, so alignment runs while Kling generates
+            align_future = stage_pool.submit(_align)
         else:
             # No audio: just use tracking video as-is (may trim if gen_secs > 0)
             print("[vannilli] No audio provided - using Kling output as-is")
-            if gen_secs > 0:
-                tracking_trimmed = base / "tracking_trimmed.mp4"
-                _run_ffmpeg(
-                    ["ffmpeg", "-y", "-i", str(tracking_path), "-t", str(gen_secs), "-c", "copy", str(tracking_trimmed)],
-                    "trim-video",
-                )
-                inp_trimmed = f"{INPUTS_PREFIX}/{generation_id}/tracking_trimmed.mp4"
-                print(f"[vannilli] Uploading trimmed video: {inp_trimmed}")
-                try:
-                    supabase.storage.from_(BUCKET).upload(inp_trimmed, tracking_trimmed.read_bytes(), file_options={"content-type": "video/mp4"})
-                    sig = supabase.storage.from_(BUCKET).create_signed_url(inp_trimmed, 3600)
-                    if isinstance(sig, tuple):
-                        sig = sig[0] if sig else {}
-                    tracking_url_for_kling = (sig.get("signedUrl") or sig.get("signed_url")) if isinstance(sig, dict) else (getattr(sig, "signedUrl", None) or getattr(sig, "signed_url", None))
-                    if not tracking_url_for_kling:
-                        tracking_url_for_kling = tracking_url
-                    print(f"[vannilli] Trimmed video uploaded OK")
-                except Exception as e:
-                    print(f"[vannilli] Trimmed video upload failed, using original: {e}")
+
+        # Trim tracking video if needed. A clip that already fits in gen_secs is passed to Kling as-is:
+        # the trim would be a no-op and its re-upload would sit on the critical path.
+        tracking_secs = _container_duration(tracking_path) if gen_secs > 0 else None
+        if tracking_secs is not None and tracking_secs <= gen_secs + 0.05:
+            print(f"[vannilli] Tracking video is {tracking_secs:.2f}s (<= {gen_secs}s) - skipping trim/re-upload")
+        elif gen_secs > 0:
+            tracking_trimmed = base / "tracking_trimmed.mp4"
+            # Stream-copy cut at gen_secs: packets are remuxed in-process, no decode/re-encode
+            _trim_copy(tracking_path, tracking_trimmed, gen_secs)
+            # Upload trimmed file for Kling
+            inp_trimmed = f"{INPUTS_PREFIX}/{generation_id}/tracking_trimmed.mp4"
+            print(f"[vannilli] Uploading trimmed video: {inp_trimmed}")
+            try:
+                with open(tracking_trimmed, "rb") as f:
+                    supabase.storage.from_(BUCKET).upload(inp_trimmed, f, file_options={"content-type": "video/mp4"})
+                sig = supabase.storage.from_(BUCKET).create_signed_url(inp_trimmed, 3600)
+                if isinstance(sig, tuple):
+                    sig = sig[0] if sig else {}
+                tracking_url_for_kling = (sig.get("signedUrl") or sig.get("signed_url")) if isinstance(sig, dict) else (getattr(sig, "signedUrl", None) or getattr(sig, "signed_url", None))
+                if not tracking_url_for_kling:
                     tracking_url_for_kling = tracking_url
-            else:
+                print(f"[vannilli] Trimmed video uploaded OK")
+            except Exception as e:
+                print(f"[vannilli] Trimmed video upload failed, using original: {e}")
                 tracking_url_for_kling = tracking_url
 
         # fal.ai Kling motion-control: driver/reference video + image. character_orientation=image.
-        fal_base_url = "https://queue.fal.run"
+        fal_base_url = _FAL_QUEUE_URL
         fal_endpoint = "fal-ai/kling-video/v2.6/standard/motion-control"  # Full endpoint for submission
-        fal_model_id = "kling-video/v2.6"  # Model ID for status/result endpoints (no namespace, no subpath)
+        fal_model_id = _FAL_MODEL_ID  # Model ID for status/result endpoints (no namespace, no subpath)
         payload = {
             "image_url": target_url,
             "video_url": tracking_url_for_kling,
@@ -217,21 +613,22 @@ def process_video_impl(data: Optional[dict] = None):
         }
         if prompt:
             payload["prompt"] = prompt[:500]
+        # Webhook mode: the callback URL carries a per-request token that /fal-complete checks
+        webhook_token = secrets.token_urlsafe(16) if _FAL_WEBHOOK_URL else None
+        params = {"fal_webhook": f"{_FAL_WEBHOOK_URL}?token={webhook_token}"} if webhook_token else None
         try:
-            r = requests.post(
+            r = _fal_http().post(
                 f"{fal_base_url}/{fal_endpoint}",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Key {fal_api_key}",
-                },
+                headers=_FAL_HEADERS,
+                params=params,
                 json=payload,
                 timeout=60,
             )
-            if not r.ok:
+            if not r.is_success:
                 try:
                     body = r.json()
                 except Exception:
-                    body = (r.text[:1500] if r.text else None) or r.reason
+                    body = (r.text[:1500] if r.text else None) or r.reason_phrase
                 err_log = f"fal.ai motion-control HTTP {r.status_code}: {body!r}"
                 print(f"[vannilli] fal.ai start FAIL: {err_log}")
                 _fail(supabase, generation_id, "Video generation failed. Please try again. If it persists, contact VANNILLI support.")
@@ -257,20 +654,62 @@ def process_video_impl(data: Optional[dict] = None):
 
         kling_units_used = None
 
+        if webhook_token:
+            # fal.ai calls /fal-complete when the video is ready and finish_generation takes it from
+            # there: no container sits waiting on Kling. The browser already polls the generation row.
+            # The state is saved before waiting on alignment so an early webhook finds it; the offset goes
+            # under its own key, and whichever of the two lands second spawns finish_generation.
+            pending_generations[task_id] = {
+                "token": webhook_token,
+                "generation_id": generation_id,
+                "audio_url": audio_url,
+                "is_trial": is_trial,
+                "gen_secs": gen_secs,
+                "submitted_at": time.time(),
+            }
+            offset = {"offset": None}
+            if align_future is not None:
+                try:
+                    offset["offset"] = align_future.result()
+                except Exception as e:
+                    print(f"[vannilli] Audio alignment failed: {type(e).__name__} {e!r}")
+                    _fail(supabase, generation_id, "Audio alignment failed. Please try again.")
+                    offset = {"failed": True}
+            pending_generations.put(f"{task_id}:offset", offset, skip_if_exists=True)
+            _maybe_finish(task_id)
+            if offset.get("failed"):
+                return {"ok": False, "error": "Audio alignment failed. Please try again."}
+            print(f"[vannilli] fal.ai request {task_id} submitted - finishing via webhook")
+            return {"ok": True, "path": f"{OUTPUTS_PREFIX}/{generation_id}/final.mp4", "kling_units_used": None}
+
         # Poll fal.ai
         kling_units_used = None  # fal.ai doesn't provide unit deduction info in the same format
-        for _ in range(60):
-            time.sleep(5)
+        # Back off from 2s up to 15s between polls: short clips are picked up soon after they
+        # finish, long ones don't hammer the status endpoint. Give up after 5 minutes.
+        deadline = time.monotonic() + 300
+        delay = 2.0
+        # Block on fal.ai's SSE status stream first: it returns the moment the request finishes, so
+        # the first poll below just confirms it and fetches the result without sleeping.
+        if _fal_wait_stream(f"{fal_base_url}/{fal_model_id}/requests/{task_id}/status/stream", deadline):
+            delay = 0.0
+        poll_errors = 0
+        while True:
+            if time.monotonic() > deadline:
+                _fail(supabase, generation_id, "Video generation timed out. Please try again.")
+                return {"ok": False, "error": "Video generation timed out. Please try again."}
+            time.sleep(delay)
+            delay = min(max(delay * 1.4, 2.0), 15.0)
             try:
                 # Get status (use base model_id, exclude subpath)
-                r = requests.get(
+                r = _fal_http().get(
                     f"{fal_base_url}/{fal_model_id}/requests/{task_id}/status",
-                    headers={"Authorization": f"Key {fal_api_key}"},
+                    headers=_FAL_AUTH,
                     timeout=30,
                 )
                 r.raise_for_status()
                 j = r.json()
                 status = j.get("status")
+                poll_errors = 0
                 
                 if status == "FAILED":
                     error_data = j.get("error", {})
@@ -280,9 +719,9 @@ def process_video_impl(data: Optional[dict] = None):
                     return {"ok": False, "error": "Video generation failed. Please try again."}
                 if status == "COMPLETED":
                     # Get the result (use base model_id, exclude subpath)
-                    result_r = requests.get(
+                    result_r = _fal_http().get(
                         f"{fal_base_url}/{fal_model_id}/requests/{task_id}",
-                        headers={"Authorization": f"Key {fal_api_key}"},
+                        headers=_FAL_AUTH,
                         timeout=30,
                     )
                     result_r.raise_for_status()
@@ -311,134 +750,34 @@ def process_video_impl(data: Optional[dict] = None):
                 elif status in ("COMPLETED", "FAILED"):
                     break
             except Exception as e:
+                # Transient errors are retried on the next poll; a run of them means fal.ai is down
+                poll_errors += 1
+                print(f"[vannilli] fal.ai poll error ({poll_errors} in a row): {type(e).__name__} {e}")
+                if poll_errors >= 10:
+                    _fail(supabase, generation_id, "Video generation status unavailable. Please try again.")
+                    return {"ok": False, "error": "Video generation status unavailable. Please try again."}
                 continue
-        else:
-            _fail(supabase, generation_id, "Video generation timed out. Please try again.")
-            return {"ok": False, "error": "Video generation timed out. Please try again."}
-
-        download(kling_video_url, kling_path)
 
-        # If audio provided, extract aligned slice and merge with Kling video
-        if audio_for_merge and isinstance(audio_for_merge, dict):
-            print("[vannilli] Extracting aligned audio slice and merging...")
+        # Prepare aligned audio for merging; alignment has been running since before the Kling submit
+        audio_for_merge = None
+        if align_future is not None:
             try:
-                # Extract audio slice using global offset
-                # Start time in master audio = 0 + offset (if offset is positive, master is ahead)
-                # For gen_secs > 0, extract exactly gen_secs starting from offset
-                audio_slice_path = base / "audio_aligned.wav"
-                start_time = max(0.0, audio_for_merge["offset"])
-                duration = audio_for_merge["duration"] if audio_for_merge["duration"] else None
-                
-                if duration:
-                    # Extract exactly gen_secs starting from offset
-                    _run_ffmpeg(
-                        [
-                            "ffmpeg", "-y", "-i", str(audio_for_merge["path"]),
-                            "-ss", str(start_time),
-                            "-t", str(duration),
-                            "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le",
-                            str(audio_slice_path)
-                        ],
-                        "extract-aligned-audio",
-                    )
-                else:
-                    # Extract from offset to end
-                    _run_ffmpeg(
-                        [
-                            "ffmpeg", "-y", "-i", str(audio_for_merge["path"]),
-                            "-ss", str(start_time),
-                            "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le",
-                            str(audio_slice_path)
-                        ],
-                        "extract-aligned-audio",
-                    )
-                
-                # Merge aligned audio with Kling video
-                _run_ffmpeg(
-                    [
-                        "ffmpeg", "-y",
-                        "-i", str(kling_path),
-                        "-i", str(audio_slice_path),
-                        "-map", "0:v:0",
-                        "-map", "1:a:0",
-                        "-c:v", "libx264",
-                        "-preset", "veryfast",
-                        "-pix_fmt", "yuv420p",
-                        "-c:a", "aac",
-                        "-b:a", "192k",
-                        "-movflags", "+faststart",
-                        "-shortest",
-                        str(synced_path),
-                    ],
-                    "merge-audio",
-                )
+                global_offset = align_future.result()
             except Exception as e:
-                print(f"[vannilli] Audio alignment/merge failed: {e}")
-                _fail(supabase, generation_id, "Audio/video merge failed. Please try again. If it persists, contact VANNILLI support.")
-                return {"ok": False, "error": "Audio/video merge failed. Please try again. If it persists, contact VANNILLI support."}
-        else:
-            # No audio provided - copy Kling video as-is (it may have audio from the tracking video)
-            print("[vannilli] No audio - using Kling output as-is")
-            import shutil
-            shutil.copy2(kling_path, synced_path)
-
-        # Only watermark: VANNILLI logo, for trial users only
-        if is_trial:
-            if watermark_path and watermark_path.exists():
-                # Use image watermark overlay (bottom-right corner, 20px padding)
-                _run_ffmpeg(
-                    [
-                        "ffmpeg", "-y",
-                        "-i", str(synced_path),
-                        "-i", str(watermark_path),
-                        "-filter_complex", "[1:v]scale=iw*0.15:-1[wm];[0:v][wm]overlay=W-w-20:H-h-20:format=auto",
-                        "-c:a", "copy",
-                        str(final_path)
-                    ],
-                    "watermark-image"
-                )
-            else:
-                # Fallback to text watermark if image download failed
-                _run_ffmpeg(
-                    [
-                        "ffmpeg", "-y",
-                        "-i", str(synced_path),
-                        "-vf", "drawtext=text='VANNILLI.io':x=(w-text_w)/2:y=h-50:fontsize=24:fontcolor=white@0.7",
-                        "-c:a", "copy",
-                        str(final_path)
-                    ],
-                    "watermark-text"
-                )
-        else:
-            final_path = synced_path
-
-        out_key = f"{OUTPUTS_PREFIX}/{generation_id}/final.mp4"
-        supabase.storage.from_(BUCKET).upload(out_key, final_path.read_bytes(), file_options={"content-type": "video/mp4"})
-
-        supabase.table("generations").update({
-            "status": "completed",
-            "final_video_r2_path": out_key,
-            "completed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-        }).eq("id", generation_id).execute()
-
-        gr = supabase.table("generations").select("project_id").eq("id", generation_id).single().execute()
-        if gr.data and gr.data.get("project_id"):
-            supabase.table("projects").update({"status": "completed"}).eq("id", gr.data["project_id"]).execute()
-
-        # Delete input files from Storage (include tracking_trimmed.mp4 when we created it)
-        inp_prefix = f"{INPUTS_PREFIX}/{generation_id}"
-        to_remove = ["tracking.mp4", "target.jpg"]
-        if audio_url:
-            to_remove.append("audio.mp3")
-        if gen_secs > 0:
-            to_remove.append("tracking_trimmed.mp4")
-        for name in to_remove:
-            try:
-                supabase.storage.from_(BUCKET).remove([f"{inp_prefix}/{name}"])
-            except Exception:
-                pass
+                print(f"[vannilli] Audio alignment failed: {type(e).__name__} {e!r}")
+                _fail(supabase, generation_id, "Audio alignment failed. Please try again.")
+                return {"ok": False, "error": "Audio alignment failed. Please try again."}
+            audio_for_merge = {
+                "path": audio_raw_path,
+                "offset": global_offset,
+                "duration": gen_secs if gen_secs > 0 else None,
+            }
 
-    return {"ok": True, "path": out_key, "kling_units_used": kling_units_used}
+        return _finish_generation(
+            supabase, base, scratch, kling_video_url,
+            generation_id=generation_id, audio_url=audio_url, is_trial=is_trial, gen_secs=gen_secs,
+            audio_for_merge=audio_for_merge, watermark_path=watermark_path, kling_units_used=kling_units_used,
+        )
 
 
 def test_kling_auth_impl():
@@ -455,14 +794,12 @@ def test_kling_auth_impl():
     # Build JWT from access+secret (same as process_video), or use single Bearer.
     jwt_token = None
     payload_redacted = None
+    expires_in = None
     if kling_access and kling_secret:
-        now = int(time.time())
-        pl = {"iss": kling_access, "exp": now + 1800, "nbf": now - 5}
-        headers = {"alg": "HS256", "typ": "JWT"}
-        tok = jwt.encode(pl, kling_secret, algorithm="HS256", headers=headers)
-        jwt_token = tok.decode("utf-8") if isinstance(tok, bytes) else tok
+        jwt_token, nbf, exp = _kling_jwt(kling_access, kling_secret)
+        expires_in = exp - int(time.time())
         iss = str(kling_access)
-        payload_redacted = {"iss": f"{iss[:8]}...{iss[-4:]}" if len(iss) > 12 else "***", "nbf": now - 5, "exp": now + 1800}
+        payload_redacted = {"iss": f"{iss[:8]}...{iss[-4:]}" if len(iss) > 12 else "***", "nbf": nbf, "exp": exp}
         bearer = jwt_token
     elif kling_api_key:
         bearer = kling_api_key
@@ -485,7 +822,7 @@ def test_kling_auth_impl():
     verify_status = None
     verify_message = None
     try:
-        r = requests.post(url, json=req_payload, headers={"Content-Type": "application/json", "Authorization": f"Bearer {bearer}"}, timeout=25)
+        r = _http().post(url, json=req_payload, headers={"Content-Type": "application/json", "Authorization": f"Bearer {bearer}"}, timeout=25)
         verify_status = r.status_code
         body = {}
         try:
@@ -500,7 +837,7 @@ def test_kling_auth_impl():
             if jwt_token:
                 out["jwt"] = jwt_token
                 out["payload_redacted"] = payload_redacted
-                out["expires_in"] = 1800
+                out["expires_in"] = expires_in
             out["message"] = verify_message
             return out
         if r.status_code >= 400:
@@ -517,40 +854,274 @@ def test_kling_auth_impl():
                 if jwt_token:
                     out["jwt"] = jwt_token
                     out["payload_redacted"] = payload_redacted
-                    out["expires_in"] = 1800
+                    out["expires_in"] = expires_in
                 return out
             verify_message = f"Auth OK. Video API returned {r.status_code} (code={code}, message={msg!r}). Dummy URLs are invalid."
         else:
             verify_message = "Auth OK. Video API accepted the request."
     except Exception as e:
         verify_message = f"Request failed: {e!r}"
-        return {"ok": False, "verify_message": verify_message, "message": verify_message, "jwt": jwt_token, "payload_redacted": payload_redacted, "expires_in": 1800 if jwt_token else None}
+        return {"ok": False, "verify_message": verify_message, "message": verify_message, "jwt": jwt_token, "payload_redacted": payload_redacted, "expires_in": expires_in}
 
     out = {"ok": True, "verify_status": verify_status, "verify_message": verify_message}
     if jwt_token:
         out["jwt"] = jwt_token
         out["payload_redacted"] = payload_redacted
-        out["expires_in"] = 1800
+        out["expires_in"] = expires_in
     out["message"] = verify_message
     return out
 
 
+def _upload_file(supabase, key: str, path: Path, content_type: str = "video/mp4"):
+    """Upload path to BUCKET/key as a raw streamed PUT to a signed upload URL (Content-Length from
+    the file, no multipart wrapping or client buffering). Falls back to the SDK upload on error."""
+    try:
+        signed = supabase.storage.from_(BUCKET).create_signed_upload_url(key)
+        url = signed.get("signed_url") or signed.get("signedUrl")
+        with open(path, "rb") as f:
+            r = _http().put(url, data=f, headers={"Content-Type": content_type}, timeout=300)
+        r.raise_for_status()
+    except Exception as e:
+        print(f"[vannilli] Signed upload failed for {key}, using SDK upload: {e}")
+        with open(path, "rb") as f:
+            supabase.storage.from_(BUCKET).upload(key, f, file_options={"content-type": content_type})
+
+
+def _remove_inputs(supabase, paths: list):
+    """Batched Storage delete of a generation's inputs (errors are logged, never raised)."""
+    try:
+        supabase.storage.from_(BUCKET).remove(paths)
+    except Exception as e:
+        print(f"[vannilli] Input cleanup failed for {paths}: {e}")
+
+
+def _remove_async(supabase, paths: list):
+    """Fire-and-forget _remove_inputs (the web container outlives the request)."""
+    threading.Thread(target=_remove_inputs, args=(supabase, paths), daemon=True).start()
+
+
 def _fail(supabase, generation_id: str, msg: str):
     supabase.table("generations").update({"status": "failed", "error_message": msg}).eq("id", generation_id).execute()
 
 
+def _drop_pending(task_id: str):
+    """Remove a webhook-mode request's saved state and its side keys."""
+    for key in (task_id, *(f"{task_id}:{side}" for side in ("offset", "video", "claimed", "finishing"))):
+        try:
+            pending_generations.pop(key)
+        except KeyError:
+            pass
+
+
+def _maybe_finish(task_id: str):
+    """Spawn finish_generation once both the audio offset (process_video) and the Kling video (webhook)
+    are saved. Both sides call this after their write; the :finishing claim makes only one spawn."""
+    offset = pending_generations.get(f"{task_id}:offset")
+    if offset is None or f"{task_id}:video" not in pending_generations:
+        return
+    if not pending_generations.put(f"{task_id}:finishing", True, skip_if_exists=True):
+        return
+    if offset.get("failed"):
+        # process_video already marked the generation failed; nothing to merge
+        _drop_pending(task_id)
+        return
+    finish_generation.spawn(task_id)
+
+
+def _fal_result(task_id: str):
+    """(status, video_url) of a fal.ai request; video_url is only looked up once status is COMPLETED."""
+    r = _fal_http().get(f"{_FAL_QUEUE_URL}/{_FAL_MODEL_ID}/requests/{task_id}/status", headers=_FAL_AUTH, timeout=30)
+    r.raise_for_status()
+    status = r.json().get("status")
+    if status != "COMPLETED":
+        return status, None
+    r = _fal_http().get(f"{_FAL_QUEUE_URL}/{_FAL_MODEL_ID}/requests/{task_id}", headers=_FAL_AUTH, timeout=30)
+    r.raise_for_status()
+    j = r.json()
+    video = (j.get("response") or {}).get("video") or j.get("video")
+    return status, video.get("url") if isinstance(video, dict) else video
+
+
+def _on_fal_complete(body: dict, token: str):
+    """fal.ai webhook: look up the state saved at submit and hand the video to finish_generation.
+    Returns (response, status); a 404 for a request we don't know makes fal.ai retry delivery."""
+    task_id = body.get("request_id") or body.get("gateway_request_id")
+    state = pending_generations.get(task_id) if task_id else None
+    if not state or not hmac.compare_digest(state["token"], token):
+        print(f"[vannilli] fal-complete: no pending generation for request {task_id!r}")
+        return {"ok": False, "error": "Unknown request"}, 404
+    # Atomic claim so a redelivered webhook (or the sweep) doesn't finish the same generation twice
+    if not pending_generations.put(f"{task_id}:claimed", True, skip_if_exists=True):
+        return {"ok": True}, 200
+    generation_id = state["generation_id"]
+    if body.get("status") != "OK":
+        print(f"[vannilli] fal.ai webhook task failed: {body.get('error')!r}")
+        _fail(_supabase_client(*_supabase_env()), generation_id, "Video generation failed. Please try again.")
+        _drop_pending(task_id)
+        return {"ok": True}, 200
+    video = (body.get("payload") or {}).get("video")
+    kling_video_url = video.get("url") if isinstance(video, dict) else video
+    if not kling_video_url:
+        _fail(_supabase_client(*_supabase_env()), generation_id, "Video generation produced no output. Please try again.")
+        _drop_pending(task_id)
+        return {"ok": True}, 200
+    # If alignment is still running, process_video spawns the finisher when its offset lands
+    pending_generations[f"{task_id}:video"] = kling_video_url
+    _maybe_finish(task_id)
+    return {"ok": True}, 200
+
+
+@app.function(image=img, secrets=[modal.Secret.from_name("vannilli-secrets")], timeout=900)
+def finish_generation(task_id: str):
+    """Webhook path: merge/watermark/upload a finished Kling video using the state saved at submit."""
+    supabase = _supabase_client(*_supabase_env())
+    state = pending_generations.get(task_id)
+    offset = pending_generations.get(f"{task_id}:offset") or {}
+    kling_video_url = pending_generations.get(f"{task_id}:video")
+    _drop_pending(task_id)
+    if state is None or not kling_video_url:
+        print(f"[vannilli] finish_generation: state for request {task_id!r} is gone")
+        return {"ok": False, "error": "Unknown request"}
+    generation_id = state["generation_id"]
+    audio_url = state.get("audio_url")
+    is_trial = state.get("is_trial", False)
+    gen_secs = state.get("gen_secs") or 0
+    scratch = _scratch_dir()
+    with tempfile.TemporaryDirectory(dir=scratch) as d:
+        base = Path(d)
+        audio_for_merge = None
+        watermark_path = None
+        try:
+            if audio_url:
+                # ffmpeg decodes the original file directly; the merge seeks it to the saved offset
+                audio_raw_path = base / f"audio_raw.{_audio_ext(audio_url)}"
+                _download(audio_url, audio_raw_path)
+                audio_for_merge = {
+                    "path": audio_raw_path,
+                    "offset": offset.get("offset") or 0.0,
+                    "duration": gen_secs if gen_secs > 0 else None,
+                }
+        except Exception as e:
+            print(f"[vannilli] finish_generation audio download failed: {e}")
+            _fail(supabase, generation_id, "Download failed. Please check your files and try again.")
+            return {"ok": False, "error": "Download failed. Please check your files and try again."}
+        if is_trial:
+            watermark_path = base / "watermark.png"
+            try:
+                watermark_path.write_bytes(_watermark_bytes(_WATERMARK_URL))
+            except Exception as e:
+                print(f"[vannilli] Warning: Failed to download watermark from {_WATERMARK_URL}: {e}. Using text watermark fallback.")
+                watermark_path = None
+        return _finish_generation(
+            supabase, base, scratch, kling_video_url,
+            generation_id=generation_id, audio_url=audio_url, is_trial=is_trial, gen_secs=gen_secs,
+            audio_for_merge=audio_for_merge, watermark_path=watermark_path, cleanup_async=False,
+        )
+
+
+@app.function(
+    image=img,
+    secrets=[modal.Secret.from_name("vannilli-secrets")],
+    schedule=modal.Period(minutes=5),
+    timeout=300,
+)
+def sweep_pending_generations():
+    """Webhook-mode fallback: a request still unfinished _FAL_WEBHOOK_TIMEOUT after submit (webhook
+    lost, or process_video died before saving its offset) is resolved from fal.ai's status endpoint
+    instead of leaving its generation 'processing' forever."""
+    supabase = _supabase_client(*_supabase_env())
+    now = time.time()
+    for task_id, state in list(pending_generations.items()):
+        if ":" in task_id:
+            # Side key whose request was already dropped (e.g. an offset saved after a failure)
+            if task_id.rsplit(":", 1)[0] not in pending_generations:
+                _drop_pending(task_id.rsplit(":", 1)[0])
+            continue
+        if now - state.get("submitted_at", now) < _FAL_WEBHOOK_TIMEOUT:
+            continue
+        generation_id = state["generation_id"]
+        if f"{task_id}:finishing" in pending_generations:
+            # finish_generation drops the entry as soon as it starts, so this one is stuck (with slack
+            # for a finisher that was only just spawned)
+            if now - state["submitted_at"] < 2 * _FAL_WEBHOOK_TIMEOUT:
+                continue
+            _fail(supabase, generation_id, "Video generation failed. Please try again.")
+            _drop_pending(task_id)
+        elif f"{task_id}:claimed" in pending_generations:
+            # The webhook delivered the video but the audio offset never arrived
+            _fail(supabase, generation_id, "Audio alignment timed out. Please try again.")
+            _drop_pending(task_id)
+        else:
+            try:
+                status, kling_video_url = _fal_result(task_id)
+            except Exception as e:
+                print(f"[vannilli] sweep: fal.ai status for {task_id} failed: {type(e).__name__} {e}")
+                continue
+            if not pending_generations.put(f"{task_id}:claimed", True, skip_if_exists=True):
+                continue  # the webhook arrived meanwhile
+            print(f"[vannilli] sweep: no webhook for fal.ai request {task_id} after {now - state['submitted_at']:.0f}s (status {status})")
+            if kling_video_url:
+                pending_generations[f"{task_id}:video"] = kling_video_url
+                _maybe_finish(task_id)
+                continue
+            if status in ("IN_QUEUE", "IN_PROGRESS"):
+                _fail(supabase, generation_id, "Video generation timed out. Please try again.")
+            elif status == "COMPLETED":
+                _fail(supabase, generation_id, "Video generation produced no output. Please try again.")
+            else:
+                _fail(supabase, generation_id, "Video generation failed. Please try again.")
+            _drop_pending(task_id)
+
+
 # ---- ASGI app with CORS for browser calls ----
-@app.function(image=img, secrets=[modal.Secret.from_name("vannilli-secrets")], timeout=600)
-@modal.asgi_app()
-def api():
-    from fastapi import FastAPI, Request
-    from fastapi.responses import JSONResponse
-    from starlette.middleware.cors import CORSMiddleware
+# min_containers keeps one restored container warm so the first request after idle skips the cold start;
+# scaledown_window holds extra containers for 5 min after a burst instead of dropping them immediately.
+@app.cls(
+    image=img,
+    secrets=[modal.Secret.from_name("vannilli-secrets")],
+    timeout=600,
+    enable_memory_snapshot=True,
+    min_containers=1,
+    scaledown_window=300,
+)
+# A generation is mostly waiting on fal.ai, so one container serves several at once instead of
+# cold-starting a container per video; each request runs on its own worker thread.
+@modal.concurrent(max_inputs=8)
+class VideoProcessor:
+    @modal.enter(snap=True)
+    def warm(self):
+        # Captured in the memory snapshot: heavy imports are already loaded via img.imports(); build the
+        # pooled HTTP clients here so restored containers don't pay for them on their first request.
+        _http()
+        _fal_http()
+        # Route table, middleware stack and response classes are built once, inside the snapshot
+        self.web = _build_web()
 
-    web = FastAPI()
+    @modal.enter(snap=False)
+    def connect(self):
+        # Supabase client holds live connections, so it is created after restore, not in the snapshot
+        # Log that we're using service_role (do not log the key). 403 often means anon key or missing RLS.
+        print(f"[vannilli] SUPABASE_SERVICE_ROLE_KEY present: {bool(_SUPA_KEY)}, len={len(_SUPA_KEY)}; FAL_API_KEY present: {bool(_FAL_KEY)}")
+        supabase_env = _supabase_env()  # no key: fail the container start, not every request
+        try:
+            _supabase_client(*supabase_env)
+        except Exception as e:
+            print(f"[vannilli] Supabase client warm-up failed (will retry per request): {e}")
+        # Open the fal.ai TLS/H2 connection in the background so the first submit on this container
+        # reuses it (the snapshot only holds the client, not live connections)
+        threading.Thread(target=_warm_fal, daemon=True).start()
+
+    # Label keeps the public URL (<workspace>--vannilli-process-video-api.modal.run) unchanged
+    @modal.asgi_app(label="vannilli-process-video-api")
+    def api(self):
+        return self.web
+
+
+def _build_web():
+    web = FastAPI(default_response_class=ORJSONResponse)
     web.add_middleware(
         CORSMiddleware,
-        allow_origins=_cors_origins(),
+        allow_origins=_CORS,
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
@@ -559,16 +1130,27 @@ def api():
     @web.post("/")
     async def post_root(req: Request):
         try:
-            data = await req.json()
+            data = orjson.loads(await req.body())
         except Exception:
             data = {}
         # Return JSON (200) even on failure to avoid browser surfacing only "CORS" for 500s.
         try:
-            out = process_video_impl(data)
+            # Blocking pipeline (downloads, polling, ffmpeg): keep it off the event loop so
+            # concurrent generations on this container proceed in parallel
+            out = await run_in_threadpool(process_video_impl, data)
         except Exception as e:
             print(f"[vannilli] process_video exception: {type(e).__name__} {e!r}")
             out = {"ok": False, "error": "Video generation failed. Please try again. If it persists, contact VANNILLI support."}
-        return JSONResponse(out, status_code=200)
+        return ORJSONResponse(out, status_code=200)
+
+    @web.post("/fal-complete")
+    async def post_fal_complete(req: Request):
+        try:
+            body = orjson.loads(await req.body())
+        except Exception:
+            body = {}
+        out, status = await run_in_threadpool(_on_fal_complete, body, req.query_params.get("token") or "")
+        return ORJSONResponse(out, status_code=status)
 
     @web.get("/test_kling_auth")
     async def get_test_kling_auth():
@@ -577,7 +1159,7 @@ def api():
         except Exception as e:
             print(f"[vannilli] test_kling_auth exception: {type(e).__name__} {e!r}")
             out = {"ok": False, "message": "Video service is not configured. Please contact VANNILLI support."}
-        return JSONResponse(out, status_code=200)
+        return ORJSONResponse(out, status_code=200)
 
     @web.get("/")
     async def get_root():
@@ -1,15 +1,26 @@
 """VideoProductionOrchestrator: Tier-based video processing with global audio alignment."""
+import atexit
+import hashlib
 import json
 import os
+import random
+import shutil
 import subprocess
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from math import ceil
 from pathlib import Path
 from typing import List, Optional, Tuple
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from audio_align import ALIGN_SAMPLE_RATE, gcc_phat_offset
 # Supabase import will be available at runtime in Modal container
 
 
@@ -32,6 +43,211 @@ class ValidationError(Exception):
     pass
 
 
+_session = None
+_supabase_clients = {}
+_kling_clients = {}
+_client_lock = threading.Lock()
+
+
+def http_session() -> requests.Session:
+    """Shared keep-alive requests.Session for this container (pooled, safe to use from worker threads).
+    Warm containers reuse its TCP/TLS connections to Supabase Storage across jobs."""
+    global _session
+    with _client_lock:
+        if _session is None:
+            _session = requests.Session()
+            # Retry transient connection errors / 429 / 5xx on idempotent calls (urllib3 never retries POST by default)
+            adapter = HTTPAdapter(
+                pool_connections=16,
+                pool_maxsize=16,
+                max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504)),
+            )
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+    return _session
+
+
+def supabase_client(url: str, key: str):
+    """Supabase client memoized per (url, key) so warm invocations skip client construction."""
+    with _client_lock:
+        client = _supabase_clients.get((url, key))
+        if client is None:
+            from supabase import create_client
+            client = _supabase_clients[(url, key)] = create_client(url, key)
+    return client
+
+
+_nvenc = None
+
+
+def h264_encode_args() -> List[str]:
+    """ffmpeg video encoder args for segment muxes: h264_nvenc when an NVIDIA device is visible and
+    ffmpeg has it (checked once per container), else libx264 veryfast."""
+    global _nvenc
+    if _nvenc is None:
+        _nvenc = False
+        if os.path.exists("/dev/nvidia0"):
+            try:
+                out = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, timeout=10).stdout
+                _nvenc = b"h264_nvenc" in out
+            except Exception:
+                pass
+        print(f"[orchestrator] h264_nvenc available: {_nvenc}")
+    if _nvenc:
+        return ["-c:v", "h264_nvenc", "-preset", "p4", "-tune", "ll", "-rc", "vbr", "-cq", "23", "-b:v", "5M"]
+    return ["-c:v", "libx264", "-preset", "veryfast"]
+
+
+def probe_video_stream(src: str) -> dict:
+    """codec_name, profile, width, height and pix_fmt of src's first video stream ({} if unreadable).
+    
+    Probed in-process with PyAV (header parse only, no ffprobe fork per chunk); ffprobe is the
+    fallback if PyAV can't open the input.
+    """
+    try:
+        import av
+        with av.open(src, timeout=30) as container:
+            ctx = container.streams.video[0].codec_context
+            return {"codec_name": ctx.name, "profile": ctx.profile, "width": ctx.width, "height": ctx.height,
+                    "pix_fmt": ctx.pix_fmt}
+    except Exception as e:
+        print(f"[orchestrator] PyAV probe failed for {src[:80]}, trying ffprobe: {e}")
+    try:
+        out = subprocess.run(
+            ["ffprobe", "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "stream=codec_name,profile,width,height,pix_fmt", "-of", "json", src],
+            capture_output=True, timeout=30, check=True,
+        ).stdout
+        return (json.loads(out).get("streams") or [{}])[0]
+    except Exception as e:
+        print(f"[orchestrator] ffprobe failed for {src[:80]}: {e}")
+    return {}
+
+
+def mux_video_args(src: str) -> List[str]:
+    """Video codec args for muxing Kling output: stream copy when it is already H.264/yuv420p
+    (nothing touches the pixels), else re-encode with h264_encode_args()."""
+    stream = probe_video_stream(src)
+    if stream.get("codec_name") == "h264" and stream.get("pix_fmt") == "yuv420p":
+        return ["-c:v", "copy"]
+    return [*h264_encode_args(), "-pix_fmt", "yuv420p"]
+
+
+def concat_video_args(segment_paths: List[Path]) -> List[str]:
+    """Video codec args for joining muxed segments into one MP4: stream copy only when every segment
+    matches segment 0's codec/profile/size/pix_fmt. An MP4 track carries a single decoder config
+    (avcC), so copying segments whose streams differ gives a file that decodes wrong after the switch;
+    those are re-encoded instead."""
+    streams = [probe_video_stream(str(seg)) for seg in segment_paths]
+    if streams[0] and all(stream == streams[0] for stream in streams[1:]):
+        return ["-c:v", "copy"]
+    print(f"[orchestrator] Segment video streams differ ({streams}), re-encoding the join")
+    return [*h264_encode_args(), "-pix_fmt", "yuv420p"]
+
+
+def signed_url(result) -> Optional[str]:
+    """URL from a storage create_signed_url() result, whichever shape this SDK version returns
+    (dict with signedUrl/signed_url, a (dict, ...) tuple, or an object with either attribute)."""
+    if isinstance(result, tuple):
+        result = result[0] if result else None
+    if isinstance(result, dict):
+        return result.get("signedUrl") or result.get("signed_url")
+    return getattr(result, "signedUrl", None) or getattr(result, "signed_url", None)
+
+
+def get_kling_client(api_key: str) -> "KlingClient":
+    """KlingClient memoized per API key, so jobs on a warm container share its fal.ai connection."""
+    with _client_lock:
+        client = _kling_clients.get(api_key)
+        if client is None:
+            client = _kling_clients[api_key] = KlingClient(api_key)
+            atexit.register(client.close)
+    return client
+
+
+def decode_pcm_mono(src: Path) -> bytes:
+    """Decode src's audio to ALIGN_SAMPLE_RATE mono float32 (raw f32le bytes) via an ffmpeg pipe."""
+    return subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-i", str(src),
+         "-vn", "-ac", "1", "-ar", str(ALIGN_SAMPLE_RATE), "-f", "f32le", "pipe:1"],
+        check=True,
+        capture_output=True,
+    ).stdout
+
+
+def download_file(url: str, path: Path, timeout: int = 120):
+    """Stream url to path in 1 MiB blocks (peak memory is one block, not the whole file)."""
+    with http_session().get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        r.raw.decode_content = True
+        with open(path, "wb") as f:
+            shutil.copyfileobj(r.raw, f, length=1 << 20)
+
+
+# Per-container download cache keyed by sha256(url). Job inputs are stored as signed URLs on the job
+# row, so a retried job asks for the exact same URLs and gets its inputs without a re-download.
+# Bounded by total bytes (it holds full source videos and master audio in /tmp), least recently used first.
+DOWNLOAD_CACHE_DIR = Path(tempfile.gettempdir()) / "vannilli-downloads"
+DOWNLOAD_CACHE_MAX_BYTES = 2 << 30
+_download_cache_lock = threading.Lock()  # lookup + link + evict; downloads themselves run unlocked
+
+
+def _link_cached(cached: Path, path: Path):
+    """Give path the cached file's contents (caller holds _download_cache_lock, so it can't be evicted)."""
+    os.utime(cached)  # mark as recently used for eviction
+    try:
+        os.link(cached, path)  # metadata-only when the work dir is on the same filesystem
+    except OSError:
+        shutil.copyfile(cached, path)
+
+
+def _evict_download_cache(keep: Path):
+    """Drop least recently used entries until the cache fits DOWNLOAD_CACHE_MAX_BYTES (caller holds the lock).
+    Jobs hold hard links or copies, so evicting an entry never touches a file in use."""
+    entries = []
+    for entry in DOWNLOAD_CACHE_DIR.glob("[0-9a-f]*[0-9a-f]"):
+        try:
+            st = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, entry))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= DOWNLOAD_CACHE_MAX_BYTES:
+            break
+        if entry != keep:
+            entry.unlink(missing_ok=True)
+            total -= size
+
+
+def cached_download_file(url: str, path: Path):
+    """download_file through the per-container cache; path is a hard link to the cached copy."""
+    DOWNLOAD_CACHE_DIR.mkdir(exist_ok=True)
+    cached = DOWNLOAD_CACHE_DIR / hashlib.sha256(url.encode()).hexdigest()
+    with _download_cache_lock:
+        if cached.exists():
+            print(f"[orchestrator] Download cache hit for {path.name}")
+            _link_cached(cached, path)
+            return
+    partial = cached.with_name(f"{cached.name}.{threading.get_ident()}.part")
+    try:
+        download_file(url, partial)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    with _download_cache_lock:
+        os.replace(partial, cached)  # atomic: a concurrent reader never sees a half-written file
+        _link_cached(cached, path)
+        _evict_download_cache(keep=cached)
+
+
+def download_files(jobs: List[Tuple[str, Path]]):
+    """Download independent (url, path) pairs concurrently; wall time ~ slowest, not the sum."""
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as pool:
+        for future in [pool.submit(cached_download_file, url, path) for url, path in jobs]:
+            future.result()
+
+
 class KlingClient:
     """Simplified fal.ai Kling video API client wrapper."""
     
@@ -40,6 +256,37 @@ class KlingClient:
         self.base_url = "https://queue.fal.run"
         self.endpoint = "fal-ai/kling-video/v2.6/standard/motion-control"  # Full endpoint for submission
         self.model_id = "kling-video/v2.6"  # Model ID for status/result endpoints (no namespace, no subpath)
+        # One pooled HTTP/2 connection for the submit and every status/result poll (multiplexed streams,
+        # HPACK-compressed auth header) instead of a fresh TLS handshake per requests.get
+        # Transport retries only replay connects that failed before the request was sent, so they
+        # are safe for the submit POST too (no duplicate paid job)
+        self.http = httpx.Client(
+            timeout=30,
+            headers={"Authorization": f"Key {api_key}"},
+            # Idle connections are kept for 5 min so back-to-back jobs on a warm container (which share
+            # this client via get_kling_client) skip the TLS/H2 setup to queue.fal.run
+            transport=httpx.HTTPTransport(
+                http2=True, retries=3,
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=16, keepalive_expiry=300),
+            ),
+        )
+    
+    def warm(self):
+        """Open the TLS/H2 connection to queue.fal.run ahead of the first real call (errors ignored)."""
+        try:
+            self.http.head(f"{self.base_url}/", timeout=5)
+        except httpx.HTTPError:
+            pass
+    
+    def close(self):
+        """Close the pooled connection."""
+        self.http.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
     
     def generate(self, driver_video_url: str, target_image_url: str, prompt: Optional[str] = None, webhook_url: Optional[str] = None) -> str:
         """Generate video via fal.ai Kling API. Returns request_id for polling.
@@ -66,15 +313,7 @@ class KlingClient:
             from urllib.parse import urlencode
             url += f"?{urlencode({'fal_webhook': webhook_url})}"
         
-        r = requests.post(
-            url,
-            headers={
-                "Content-Type": "application/json",
-                "Authorization": f"Key {self.api_key}",
-            },
-            json=payload,
-            timeout=60,
-        )
+        r = self.http.post(url, json=payload, timeout=60)
         r.raise_for_status()
         j = r.json()
         
@@ -85,35 +324,98 @@ class KlingClient:
             raise Exception(f"fal.ai API error: {error_msg}")
         return request_id
     
-    def poll_status(self, request_id: str, max_attempts: int = 60) -> Tuple[str, Optional[str]]:
-        """Poll fal.ai task status. Returns (status, video_url). Status: 'succeed', 'failed', 'processing'."""
+    def wait_stream(self, request_id: str, deadline: float, cancelled: Optional[threading.Event] = None) -> bool:
+        """Follow fal.ai's queue status SSE stream until a terminal status. True when the request
+        finished (COMPLETED/FAILED); False if the stream failed, ended early, hit the deadline or
+        `cancelled` was set (the stream is then read in 10s slices so a cancel is seen promptly)."""
+        while True:
+            try:
+                read_timeout = max(1.0, deadline - time.monotonic())
+                if cancelled is not None:
+                    read_timeout = min(read_timeout, 10.0)
+                with self.http.stream(
+                    "GET",
+                    f"{self.base_url}/{self.model_id}/requests/{request_id}/status/stream",
+                    timeout=httpx.Timeout(30.0, read=read_timeout),
+                ) as r:
+                    if r.status_code != 200:
+                        print(f"[fal.ai] Status stream HTTP {r.status_code}, falling back to polling")
+                        return False
+                    for line in r.iter_lines():
+                        if cancelled is not None and cancelled.is_set():
+                            return False
+                        if not line.startswith("data:"):
+                            continue
+                        try:
+                            status = json.loads(line[5:]).get("status")
+                        except ValueError:
+                            continue
+                        if status in ("COMPLETED", "FAILED"):
+                            return True
+                        if time.monotonic() > deadline:
+                            return False
+                return False
+            except httpx.ReadTimeout:
+                # A quiet slice: check for a cancel, then reopen the stream
+                if cancelled is not None and not cancelled.is_set() and time.monotonic() < deadline:
+                    continue
+                return False
+            except Exception as e:
+                print(f"[fal.ai] Status stream error, falling back to polling: {type(e).__name__} {e}")
+                return False
+    
+    def poll_status(
+        self, request_id: str, max_attempts: int = 60, cancelled: Optional[threading.Event] = None,
+    ) -> Tuple[str, Optional[str]]:
+        """Poll fal.ai task status. Returns (status, video_url). Status: 'succeed', 'failed', 'processing',
+        or 'cancelled' when the `cancelled` event is set while waiting.
+
+        fal.ai pushes status changes over an SSE stream, so this first blocks on that and the first
+        poll just fetches the result. If the stream is unavailable, polls back off from 1s to 8s within
+        the same max_attempts * 5s budget as a fixed 5s cadence (with jitter, so concurrent chunks
+        don't poll in lockstep), honouring Retry-After when fal.ai throttles.
+        """
         status_poll_failures = 0
         max_status_failures = 10  # After 10 status poll failures, try direct result fetch
         
-        for attempt in range(max_attempts):
-            time.sleep(5)
+        started = time.monotonic()
+        deadline = started + max_attempts * 5
+        delay = 1.0
+        if self.wait_stream(request_id, deadline, cancelled):
+            delay = 0.0
+        attempt = -1
+        while time.monotonic() < deadline:
+            pause = delay + random.uniform(0, delay * 0.1)
+            if cancelled is None:
+                time.sleep(pause)
+            elif cancelled.wait(pause):
+                print(f"[fal.ai] Stopped polling {request_id}: cancelled")
+                return ("cancelled", None)
+            delay = min(max(delay * 1.5, 1.0), 8.0)
+            attempt += 1
             try:
                 # fal.ai queue API: get status (use base model_id, exclude subpath)
-                r = requests.get(
+                r = self.http.get(
                     f"{self.base_url}/{self.model_id}/requests/{request_id}/status",
-                    headers={"Authorization": f"Key {self.api_key}"},
-                    timeout=30,
                 )
+                if r.status_code in (429, 503) and r.headers.get("Retry-After", "").isdigit():
+                    # Throttled: wait exactly as long as asked (not a failure)
+                    delay = float(r.headers["Retry-After"])
+                    print(f"[fal.ai] Poll throttled (HTTP {r.status_code}), retrying after {delay:.0f}s")
+                    continue
                 r.raise_for_status()
                 j = r.json()
                 status_poll_failures = 0  # Reset on success
                 
                 # fal.ai status format: "IN_QUEUE", "IN_PROGRESS", "COMPLETED", "FAILED"
                 status = j.get("status")
-                print(f"[fal.ai] Poll attempt {attempt + 1}/{max_attempts}: status = {status}")
+                print(f"[fal.ai] Poll attempt {attempt + 1} ({time.monotonic() - started:.0f}s): status = {status}")
                 
                 if status == "COMPLETED":
                     print(f"[fal.ai] Status is COMPLETED, fetching result for request_id: {request_id}")
                     # Get the result (use base model_id, exclude subpath)
-                    result_r = requests.get(
+                    result_r = self.http.get(
                         f"{self.base_url}/{self.model_id}/requests/{request_id}",
-                        headers={"Authorization": f"Key {self.api_key}"},
-                        timeout=30,
                     )
                     result_r.raise_for_status()
                     result_j = result_r.json()
@@ -159,7 +461,7 @@ class KlingClient:
                     continue
                 elif status in ("COMPLETED", "FAILED"):
                     break
-            except requests.exceptions.RequestException as e:
+            except (httpx.HTTPError, ValueError) as e:
                 status_poll_failures += 1
                 print(f"[fal.ai] Poll error: {e}, continuing...")
                 
@@ -168,10 +470,8 @@ class KlingClient:
                 if status_poll_failures >= max_status_failures and attempt >= 5:  # Wait at least 5 attempts before trying fallback
                     print(f"[fal.ai] Status polling failed {status_poll_failures} times, trying direct result fetch as fallback...")
                     try:
-                        result_r = requests.get(
+                        result_r = self.http.get(
                             f"{self.base_url}/{self.model_id}/requests/{request_id}",
-                            headers={"Authorization": f"Key {self.api_key}"},
-                            timeout=30,
                         )
                         if result_r.status_code == 200:
                             result_j = result_r.json()
@@ -205,6 +505,7 @@ class VideoProductionOrchestrator:
     """Orchestrates tier-based video production with global audio alignment."""
     
     CHUNK_LIMIT = 9.0  # seconds
+    SINGLE_CALL_LIMIT = 10.0  # seconds; Kling's per-call cap, videos up to this skip chunking entirely
     INDUSTRY_MAX_DURATION = 90.0  # seconds
     
     def __init__(self, kling_client: KlingClient, user_tier: str, supabase_client):
@@ -227,8 +528,10 @@ class VideoProductionOrchestrator:
         
         Raises:
             TierRestrictionError: If lower tier submits > 9s video
-            ValidationError: If industry/demo tier exceeds max duration
+            ValidationError: If the video has no duration, or industry/demo tier exceeds max duration
         """
+        if video_duration <= 0:
+            raise ValidationError("Video has no duration.")
         if self.tier == Tier.DEMO:
             if video_duration > 20.0:
                 raise ValidationError(f"DEMO tier limited to 20s.")
@@ -241,7 +544,16 @@ class VideoProductionOrchestrator:
             )
     
     def get_video_duration(self, video_path: Path) -> float:
-        """Get video duration in seconds using ffprobe."""
+        """Get video duration in seconds from the container header (PyAV: a header parse in-process,
+        no ffprobe fork/exec). Falls back to ffprobe if PyAV is missing, can't read the container, or
+        the container has no duration."""
+        try:
+            import av
+            with av.open(str(video_path)) as container:
+                if container.duration is not None:
+                    return float(container.duration) / av.time_base
+        except Exception as e:
+            print(f"[orchestrator] PyAV duration probe failed, using ffprobe: {e}")
         result = subprocess.run(
             [
                 "ffprobe", "-v", "error", "-show_entries", "format=duration",
@@ -253,152 +565,143 @@ class VideoProductionOrchestrator:
         )
         return float(result.stdout.strip())
     
-    def find_global_offset(self, user_video_path: Path, master_audio_path: Path) -> float:
-        """Find global sync offset between video and master audio using audalign.
+    def find_global_offset(
+        self, user_video_path: Path, master_audio_path: Path, video_pcm: Optional[bytes] = None,
+    ) -> float:
+        """Find global sync offset between video and master audio by GCC-PHAT cross-correlation.
+        
+        Both tracks are decoded straight into memory (ffmpeg pipe, no temp WAV) at ALIGN_SAMPLE_RATE
+        mono and correlated with one FFT, instead of fingerprinting them with audalign.
+        
+        Args:
+            video_pcm: The video's audio already decoded with decode_pcm_mono (decoded here if None)
         
         Returns:
             Offset in seconds. Positive means master audio is ahead of video.
         """
-        try:
-            import audalign
-        except ImportError:
-            raise Exception("audalign not installed. Install with: pip install audalign")
-        
-        # Extract audio from video for alignment
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_video_audio:
-            tmp_video_audio_path = Path(tmp_video_audio.name)
+        import numpy as np
         
-        try:
-            subprocess.run(
-                [
-                    "ffmpeg", "-y", "-i", str(user_video_path),
-                    "-ac", "1", "-ar", "16000", "-c:a", "pcm_s16le",
-                    str(tmp_video_audio_path)
-                ],
-                check=True,
-                capture_output=True,
-            )
-            
-            # Use audalign to find sync offset
-            alignment = audalign.target_align(
-                str(master_audio_path),
-                str(tmp_video_audio_path),
-            )
-            
-            # audalign returns offset in seconds
-            # Positive offset means master is ahead of video
-            offset = alignment.get("offset", 0.0)
-            if not isinstance(offset, (int, float)):
-                offset = float(offset)
-            return offset
-        finally:
-            if tmp_video_audio_path.exists():
-                tmp_video_audio_path.unlink()
+        if video_pcm is None:
+            video_pcm = decode_pcm_mono(user_video_path)
+        master = np.frombuffer(decode_pcm_mono(master_audio_path), dtype=np.float32)
+        video_audio = np.frombuffer(video_pcm, dtype=np.float32)
+        if not len(master) or not len(video_audio):
+            raise Exception("No audio to align (master or tracking video audio is empty)")
+        # Seconds into master where the video's audio starts (negative: video starts before master)
+        return gcc_phat_offset(master, video_audio, ALIGN_SAMPLE_RATE)
     
-    def split_video_file(self, video_path: Path, chunk_duration: float, output_dir: Path) -> List[Path]:
-        """Split video into chunks of specified duration.
+    def split_video_file(self, video_path: Path, chunk_duration: float, output_dir: Path) -> List[Tuple[Path, float]]:
+        """Split video into chunks of chunk_duration in one segment-muxer pass.
+        
+        The video is re-encoded with keyframes forced at every chunk boundary (as worker_loop does):
+        a stream copy can only cut on the upload's own keyframes, so long-GOP sources would produce
+        chunks past CHUNK_LIMIT and Kling's per-call cap.
         
         Returns:
-            List of chunk file paths
+            List of (chunk file path, chunk start time in seconds), read back from the segment list.
         """
+        list_path = output_dir / "chunks.csv"
+        subprocess.run(
+            [
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(video_path),
+                # Only the first video and (optional) audio track: data/timecode tracks (e.g. tmcd in
+                # iPhone MOVs) can't go into the mp4 segments
+                "-map", "0:v:0", "-map", "0:a?",
+                "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+                "-force_key_frames", f"expr:gte(t,n_forced*{chunk_duration})",  # Exact cut points
+                "-c:a", "aac",
+                "-f", "segment",
+                "-segment_time", str(chunk_duration),
+                "-reset_timestamps", "1",
+                "-segment_list", str(list_path),
+                "-segment_list_type", "csv",
+                str(output_dir / "chunk_%03d.mp4")
+            ],
+            check=True,
+            capture_output=True,
+        )
         chunks = []
-        video_duration = self.get_video_duration(video_path)
-        num_chunks = int(ceil(video_duration / chunk_duration))
+        for line in list_path.read_text().splitlines():
+            name, start, _end = line.rsplit(",", 2)
+            chunks.append((output_dir / name, float(start)))
+        return chunks
+    
+    def mux_video_audio(
+        self, video_path, audio_path: Path, output_path: Path,
+        start_time: Optional[float] = None, duration: Optional[float] = None, threads: int = 0,
+    ):
+        """Mux AI-generated video (local path or http(s) URL) with clean audio in one ffmpeg pass.
         
-        for i in range(num_chunks):
-            start_time = i * chunk_duration
-            chunk_path = output_dir / f"chunk_{i:03d}.mp4"
-            
-            # Extract chunk: -ss start, -t duration, -c copy for speed
+        Args:
+            video_path: Kling output (path or URL)
+            audio_path: Master audio file
+            output_path: Output segment path (.ts segments are what stitch_segments expects)
+            start_time: Start time in master audio (already includes global offset)
+            duration: Duration to take from the master audio
+            threads: ffmpeg -threads (0 = auto; 1 when several muxes share the CPU)
+        """
+        video_input = ["-i", str(video_path)]
+        if str(video_path).startswith(("http://", "https://")):
+            # ffmpeg reads the URL itself (HTTP range reads cope with a trailing moov atom)
+            video_input = ["-reconnect", "1", "-reconnect_streamed", "1", *video_input]
+        # The audio slice is cut on the audio input itself (-ss before -i seeks instead of decoding up
+        # to start_time), so there is no separate extract process or intermediate WAV
+        audio_input = ["-i", str(audio_path)]
+        if duration is not None:
+            audio_input = ["-t", str(duration), *audio_input]
+        if start_time is not None:
+            audio_input = ["-ss", str(start_time), *audio_input]
+        def run(video_args: List[str]):
             subprocess.run(
                 [
-                    "ffmpeg", "-y", "-i", str(video_path),
-                    "-ss", str(start_time),
-                    "-t", str(chunk_duration),
-                    "-c", "copy",  # Fast copy, no re-encode
-                    str(chunk_path)
+                    "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y",
+                    *video_input,
+                    *audio_input,
+                    "-map", "0:v:0",
+                    "-map", "1:a:0",
+                    "-threads", str(threads),
+                    *video_args,
+                    "-c:a", "aac",
+                    "-b:a", "192k",
+                    "-shortest",
+                    str(output_path)
                 ],
                 check=True,
                 capture_output=True,
             )
-            chunks.append(chunk_path)
         
-        return chunks
+        video_args = mux_video_args(str(video_path))
+        try:
+            run(video_args)
+        except subprocess.CalledProcessError as e:
+            if video_args[-1] != "copy":
+                raise
+            # Kling changed its stream in a way the copy can't carry: re-encode (NVENC when available)
+            print(f"[orchestrator] Stream-copy mux failed, re-encoding: {(e.stderr or b'')[-500:]!r}")
+            run([*h264_encode_args(), "-pix_fmt", "yuv420p"])
     
-    def extract_audio_slice(
-        self, master_audio_path: Path, start_time: float, duration: float, output_path: Path
-    ):
-        """Extract audio slice from master track using global offset.
+    def stitch_segments(self, segment_paths: List[Path], output_path: Path):
+        """Stitch MPEG-TS segments into one final MP4.
         
-        Args:
-            master_audio_path: Path to master audio file
-            start_time: Start time in master audio (already includes global offset)
-            duration: Duration to extract
-            output_path: Output WAV file path
+        TS segments are byte-concatenable, so the concat protocol joins them without a list file.
+        The video is stream-copied when all segments share the same stream parameters, and re-encoded
+        otherwise (see concat_video_args). A single segment goes through the same remux, which turns it
+        into the MP4 the caller uploads.
         """
         subprocess.run(
             [
-                "ffmpeg", "-y", "-i", str(master_audio_path),
-                "-ss", str(start_time),
-                "-t", str(duration),
-                "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le",
-                str(output_path)
-            ],
-            check=True,
-            capture_output=True,
-        )
-    
-    def mux_video_audio(self, video_path: Path, audio_path: Path, output_path: Path):
-        """Mux AI-generated video with clean audio slice."""
-        subprocess.run(
-            [
-                "ffmpeg", "-y",
-                "-i", str(video_path),
-                "-i", str(audio_path),
-                "-map", "0:v:0",
-                "-map", "1:a:0",
-                "-c:v", "libx264",
-                "-preset", "veryfast",
-                "-pix_fmt", "yuv420p",
-                "-c:a", "aac",
-                "-b:a", "192k",
+                "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y",
+                "-i", "concat:" + "|".join(str(seg) for seg in segment_paths),
+                *concat_video_args(segment_paths),
+                "-c:a", "copy",
+                "-bsf:a", "aac_adtstoasc",  # ADTS AAC (TS) -> MP4 AudioSpecificConfig
                 "-movflags", "+faststart",
-                "-shortest",
                 str(output_path)
             ],
             check=True,
             capture_output=True,
         )
     
-    def stitch_segments(self, segment_paths: List[Path], output_path: Path):
-        """Stitch multiple video segments into one final video."""
-        if len(segment_paths) == 1:
-            # Just copy the single segment
-            subprocess.run(["cp", str(segment_paths[0]), str(output_path)], check=True)
-            return
-        
-        # Create concat file for ffmpeg
-        concat_file = output_path.parent / "concat_list.txt"
-        with open(concat_file, "w") as f:
-            for seg in segment_paths:
-                f.write(f"file '{seg.absolute()}'\n")
-        
-        try:
-            subprocess.run(
-                [
-                    "ffmpeg", "-y",
-                    "-f", "concat", "-safe", "0",
-                    "-i", str(concat_file),
-                    "-c", "copy",  # Fast copy, no re-encode
-                    str(output_path)
-                ],
-                check=True,
-                capture_output=True,
-            )
-        finally:
-            if concat_file.exists():
-                concat_file.unlink()
-    
     def process_job(
         self,
         user_video_url: str,
@@ -427,29 +730,31 @@ class VideoProductionOrchestrator:
             user_video_path = work_path / "user_video.mp4"
             master_audio_path = work_path / "master_audio.wav"
             
-            # Download source files
+            # Download source files (concurrently). The master audio download runs in the background:
+            # probing the video and decoding its audio for alignment only need the video, so they
+            # start as soon as it lands instead of waiting for both files.
             print(f"[orchestrator] Downloading user video from {user_video_url}")
-            r = requests.get(user_video_url, timeout=120)
-            r.raise_for_status()
-            user_video_path.write_bytes(r.content)
-            
             print(f"[orchestrator] Downloading master audio from {master_audio_url}")
-            r = requests.get(master_audio_url, timeout=120)
-            r.raise_for_status()
-            master_audio_path.write_bytes(r.content)
-            
-            # 1. Get duration & validate tier
-            duration = self.get_video_duration(user_video_path)
-            print(f"[orchestrator] Video duration: {duration}s, tier: {self.tier.value}")
-            self.validate_submission(duration)
-            
-            # 2. GLOBAL ALIGNMENT (use provided offset if available, otherwise calculate)
-            if sync_offset is not None:
-                global_offset = sync_offset
-                print(f"[orchestrator] Using provided sync offset: {global_offset}s")
-            else:
-                print("[orchestrator] Performing global audio alignment...")
-                global_offset = self.find_global_offset(user_video_path, master_audio_path)
+            with ThreadPoolExecutor(max_workers=2) as prep_pool:
+                master_download = prep_pool.submit(cached_download_file, master_audio_url, master_audio_path)
+                cached_download_file(user_video_url, user_video_path)
+                video_pcm = prep_pool.submit(decode_pcm_mono, user_video_path) if sync_offset is None else None
+                
+                # 1. Get duration & validate tier
+                duration = self.get_video_duration(user_video_path)
+                print(f"[orchestrator] Video duration: {duration}s, tier: {self.tier.value}")
+                self.validate_submission(duration)
+                master_download.result()
+                
+                # 2. GLOBAL ALIGNMENT (use provided offset if available, otherwise calculate)
+                if sync_offset is not None:
+                    global_offset = sync_offset
+                    print(f"[orchestrator] Using provided sync offset: {global_offset}s")
+                else:
+                    print("[orchestrator] Performing global audio alignment...")
+                    global_offset = self.find_global_offset(
+                        user_video_path, master_audio_path, video_pcm=video_pcm.result(),
+                    )
             print(f"[orchestrator] Global offset: {global_offset}s (master is {'ahead' if global_offset > 0 else 'behind'} video)")
             
             # 3. Determine chunk size
@@ -457,9 +762,13 @@ class VideoProductionOrchestrator:
             # For others: use fixed CHUNK_LIMIT (9s)
             use_tempo_chunking = (self.tier == Tier.INDUSTRY or self.tier.value == 'demo') and chunk_duration is not None
             effective_chunk_size = chunk_duration if use_tempo_chunking else self.CHUNK_LIMIT
+            # A video that fits in one Kling call (e.g. 10s with a 9s chunk limit) would otherwise cost a
+            # second full generation round-trip plus a stitch; send it whole instead. Tempo chunks are
+            # kept as analyzed (their boundaries sit on beats)
+            if not use_tempo_chunking and 0 < duration <= min(self.CHUNK_LIMIT * 1.15, self.SINGLE_CALL_LIMIT):
+                effective_chunk_size = duration
             
             # 4. Execution pipeline
-            final_segments = []
             num_chunks = int(ceil(duration / effective_chunk_size))
             
             print(f"[orchestrator] Using chunk size: {effective_chunk_size:.2f}s, will create {num_chunks} chunks")
@@ -469,38 +778,37 @@ class VideoProductionOrchestrator:
                 print(f"[orchestrator] Splitting video into {num_chunks} chunks...")
                 video_chunks = self.split_video_file(user_video_path, effective_chunk_size, work_path)
             else:
-                video_chunks = [user_video_path]
+                video_chunks = [(user_video_path, 0.0)]
             
             chunks_dir = work_path / "chunks"
             chunks_dir.mkdir(exist_ok=True)
             
-            for i, vid_chunk in enumerate(video_chunks):
-                print(f"[orchestrator] Processing chunk {i+1}/{len(video_chunks)}...")
-                
+            # Kling waits overlap freely, but chunk muxes are capped at one per CPU, each ffmpeg on a
+            # single thread, so a burst of finished chunks saturates the box without oversubscribing it
+            mux_workers = min(os.cpu_count() or 1, len(video_chunks))
+            mux_slots = threading.BoundedSemaphore(mux_workers)
+            mux_threads = 1 if mux_workers > 1 else 0
+            # Chunk uploads run concurrently too, four at a time, so the first chunks' Kling submits
+            # start as soon as their own upload is signed without saturating the uplink
+            upload_slots = threading.BoundedSemaphore(4)
+            
+            def process_chunk(i: int, vid_chunk: Path, chunk_start: float) -> Path:
                 # A. Process visuals (Kling API)
                 current_image = images[i % len(images)]
                 
                 # Upload chunk to temporary storage for Kling
                 # In production, upload to Supabase Storage and get signed URL
                 chunk_storage_path = f"temp_chunks/{generation_id or 'temp'}/chunk_{i:03d}.mp4"
-                with open(vid_chunk, "rb") as f:
-                    self.supabase.storage.from_("vannilli").upload(chunk_storage_path, f.read(), file_options={"content-type": "video/mp4"})
+                with upload_slots, open(vid_chunk, "rb") as f:
+                    self.supabase.storage.from_("vannilli").upload(chunk_storage_path, f, file_options={"content-type": "video/mp4"})
                 
                 # Get signed URL for Kling
-                signed_url_result = self.supabase.storage.from_("vannilli").create_signed_url(chunk_storage_path, 3600)
-                if isinstance(signed_url_result, tuple):
-                    signed_url_result = signed_url_result[0] if signed_url_result else {}
-                elif hasattr(signed_url_result, 'signedUrl'):
-                    signed_url_result = {"signedUrl": signed_url_result.signedUrl}
-                elif hasattr(signed_url_result, 'signed_url'):
-                    signed_url_result = {"signed_url": signed_url_result.signed_url}
-                
-                chunk_url = signed_url_result.get("signedUrl") or signed_url_result.get("signed_url") if isinstance(signed_url_result, dict) else None
+                chunk_url = signed_url(self.supabase.storage.from_("vannilli").create_signed_url(chunk_storage_path, 3600))
                 
                 if not chunk_url:
                     raise Exception(f"Failed to create signed URL for chunk {i+1}")
                 
-                print(f"[orchestrator] Calling Kling API for chunk {i+1}...")
+                print(f"[orchestrator] Calling Kling API for chunk {i+1}/{len(video_chunks)}...")
                 task_id = self.kling_client.generate(chunk_url, current_image, prompt)
                 
                 # Poll for completion
@@ -508,31 +816,36 @@ class VideoProductionOrchestrator:
                 if status != "succeed" or not kling_video_url:
                     raise Exception(f"Kling generation failed for chunk {i+1}")
                 
-                # Download Kling output
-                kling_output_path = chunks_dir / f"kling_chunk_{i:03d}.mp4"
-                r = requests.get(kling_video_url, timeout=120)
-                r.raise_for_status()
-                kling_output_path.write_bytes(r.content)
-                
-                # B. Mathematical audio slicing (no new sync)
-                chunk_start_time = (i * effective_chunk_size) + global_offset
-                actual_chunk_duration = min(effective_chunk_size, duration - (i * effective_chunk_size))
+                # B. Mathematical audio slicing (no new sync): the chunk's span of the source video,
+                # shifted by the global offset
+                chunk_end = video_chunks[i + 1][1] if i + 1 < len(video_chunks) else duration
+                chunk_start_time = chunk_start + global_offset
+                actual_chunk_duration = chunk_end - chunk_start
                 
-                audio_slice_path = chunks_dir / f"audio_chunk_{i:03d}.wav"
-                self.extract_audio_slice(master_audio_path, chunk_start_time, actual_chunk_duration, audio_slice_path)
-                
-                # C. Mux (combine AI video + clean audio)
-                segment_path = chunks_dir / f"segment_{i:03d}.mp4"
-                self.mux_video_audio(kling_output_path, audio_slice_path, segment_path)
-                final_segments.append(segment_path)
+                # C. Mux (combine AI video + clean audio slice) in one ffmpeg pass. Kling output is
+                # only read once, here: ffmpeg pulls it from the URL instead of a disk copy
+                segment_path = chunks_dir / f"segment_{i:03d}.ts"
+                with mux_slots:
+                    self.mux_video_audio(
+                        kling_video_url, master_audio_path, segment_path,
+                        start_time=chunk_start_time, duration=actual_chunk_duration, threads=mux_threads,
+                    )
+                return segment_path
             
-            # 4. Final output
+            # Chunks are independent (Kling runs them in parallel on its side): submit them all up front
+            # and poll concurrently over KlingClient's shared HTTP/2 connection, so wall time is
+            # ~the slowest chunk instead of the sum. Segments come back in chunk order for stitching.
+            with ThreadPoolExecutor(max_workers=min(len(video_chunks), 8)) as pool:
+                futures = [
+                    pool.submit(process_chunk, i, vid_chunk, chunk_start)
+                    for i, (vid_chunk, chunk_start) in enumerate(video_chunks)
+                ]
+                final_segments = [future.result() for future in futures]
+            
+            # 4. Final output (always remuxed: the segments are MPEG-TS)
             final_output_path = work_path / "final.mp4"
-            if len(final_segments) > 1:
-                print("[orchestrator] Stitching segments...")
-                self.stitch_segments(final_segments, final_output_path)
-            else:
-                final_output_path = final_segments[0]
+            print(f"[orchestrator] Stitching {len(final_segments)} segment(s)...")
+            self.stitch_segments(final_segments, final_output_path)
             
             # Copy to persistent location (or upload to storage)
             # For now, return the path (caller handles upload)
@@ -1,8 +1,10 @@
 """Modal worker loop: Processes video jobs from queue with tier-based priority."""
 import os
 import sys
+import threading
 import time
 from pathlib import Path
+from typing import Optional
 
 import modal
 
@@ -17,12 +19,14 @@ app = modal.App("vannilli-video-worker")
 img = (
     modal.Image.debian_slim()
     .apt_install("ffmpeg")
-    .pip_install("requests", "supabase", "audalign", "pyjwt", "librosa", "numpy")
+    .pip_install("requests", "supabase", "audalign", "pyjwt", "librosa", "numpy", "httpx[http2]", "av")
     .add_local_dir(Path(__file__).parent, remote_path="/root/modal_app")
 )
 
 BUCKET = "vannilli"
 OUTPUTS_PREFIX = "outputs"
+CHUNK_WORKERS = 8  # chunks of one job uploaded / generated / muxed concurrently
+CANCEL_CHECK_INTERVAL = 5.0  # seconds between generation-row checks for a user cancel while chunks run
 
 
 def get_fal_api_key() -> str:
@@ -62,8 +66,7 @@ def worker_loop():
         sys.path.insert(0, str(current_dir))
     
     from job_queue_manager import JobQueueManager
-    from video_orchestrator import VideoProductionOrchestrator, KlingClient
-    from supabase import create_client
+    from video_orchestrator import VideoProductionOrchestrator, get_kling_client, signed_url, supabase_client
     
     supabase_url = os.environ.get("SUPABASE_URL", "").rstrip("/")
     supabase_key = os.environ["SUPABASE_SERVICE_ROLE_KEY"]
@@ -72,8 +75,9 @@ def worker_loop():
         print("[worker] Missing Supabase configuration")
         return
     
-    supabase = create_client(supabase_url, supabase_key)
-    queue_manager = JobQueueManager(supabase_url, supabase_key)
+    # Cached per container: warm runs reuse the client (and its pooled connections)
+    supabase = supabase_client(supabase_url, supabase_key)
+    queue_manager = JobQueueManager(supabase_url, supabase_key, supabase_client=supabase)
     
     # 1. CHECK CONCURRENCY
     limit = queue_manager.get_concurrency_limit()
@@ -89,6 +93,13 @@ def worker_loop():
         print("[worker] Queue empty.")
         return
     
+    # Warm the fal.ai connection in the background while the job's checks run, so the first Kling
+    # submit of a fresh container doesn't pay the TLS/H2 handshake
+    try:
+        threading.Thread(target=get_kling_client(get_fal_api_key()).warm, daemon=True).start()
+    except Exception as e:
+        print(f"[worker] fal.ai connection warm-up skipped: {e}")
+    
     job_id = job["id"]
     user_tier = job["tier"]
     generation_id = job.get("generation_id")
@@ -142,7 +153,7 @@ def worker_loop():
     try:
         # Initialize fal.ai Kling client
         fal_api_key = get_fal_api_key()
-        kling_client = KlingClient(fal_api_key)
+        kling_client = get_kling_client(fal_api_key)  # reused across jobs on this container
         
         # Initialize orchestrator
         orchestrator = VideoProductionOrchestrator(kling_client, user_tier, supabase)
@@ -202,13 +213,10 @@ def worker_loop():
         print(f"[worker] Final video file exists: {final_video_path}, size: {final_video_path.stat().st_size / 1024 / 1024:.2f} MB")
         
         with open(final_video_path, "rb") as f:
-            supabase.storage.from_(BUCKET).upload(output_key, f.read(), file_options={"content-type": "video/mp4"})
+            supabase.storage.from_(BUCKET).upload(output_key, f, file_options={"content-type": "video/mp4"})
         
         # Get public/signed URL
-        signed_url_data = supabase.storage.from_(BUCKET).create_signed_url(output_key, 3600)
-        if isinstance(signed_url_data, tuple):
-            signed_url_data = signed_url_data[0] if signed_url_data else {}
-        output_url = (signed_url_data.get("signedUrl") or signed_url_data.get("signed_url")) if isinstance(signed_url_data, dict) else None
+        output_url = signed_url(supabase.storage.from_(BUCKET).create_signed_url(output_key, 3600))
         
         if not output_url:
             output_url = f"{supabase_url}/storage/v1/object/public/{BUCKET}/{output_key}"
@@ -219,7 +227,9 @@ def worker_loop():
         # Update generation record if linked
         if generation_id:
             completed_time = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-            supabase.table("generations").update({
+            # The update returns the updated row (PostgREST return=representation), so project_id
+            # comes back with it - no separate SELECT round-trip
+            gen_rows = supabase.table("generations").update({
                 "status": "completed",
                 "final_video_r2_path": output_key,
                 "completed_at": completed_time,
@@ -228,9 +238,9 @@ def worker_loop():
                 "estimated_completion_at": None,  # Clear estimate when done
             }).eq("id", generation_id).execute()
             
-            gen_data = supabase.table("generations").select("project_id").eq("id", generation_id).single().execute()
-            if gen_data.data and gen_data.data.get("project_id"):
-                supabase.table("projects").update({"status": "completed"}).eq("id", gen_data.data["project_id"]).execute()
+            project_id = gen_rows.data[0].get("project_id") if gen_rows.data else None
+            if project_id:
+                supabase.table("projects").update({"status": "completed"}).eq("id", project_id).execute()
         
         print(f"[worker] Job {job_id} completed successfully")
         
@@ -266,6 +276,8 @@ def process_job_with_chunks(
     import time
     from pathlib import Path
     from math import ceil
+    from concurrent.futures import ThreadPoolExecutor
+    from video_orchestrator import concat_video_args, download_files, h264_encode_args, mux_video_args, signed_url
     
     with tempfile.TemporaryDirectory() as work_dir:
         work_path = Path(work_dir)
@@ -274,17 +286,10 @@ def process_job_with_chunks(
         user_video_path = work_path / "user_video.mp4"
         master_audio_path = work_path / "master_audio.wav"
         
-        # Download files
+        # Download files (concurrently)
         print(f"[worker] Downloading video from {user_video_url}")
-        r = requests.get(user_video_url, timeout=120)
-        r.raise_for_status()
-        user_video_raw_path.write_bytes(r.content)
-        
         print(f"[worker] Downloading audio from {master_audio_url}")
-        r = requests.get(master_audio_url, timeout=120)
-        r.raise_for_status()
-        audio_content = r.content
-        master_audio_raw_path.write_bytes(audio_content)
+        download_files([(user_video_url, user_video_raw_path), (master_audio_url, master_audio_raw_path)])
         
         # Convert audio to WAV if needed (MP3, MP4, or other formats)
         audio_ext = master_audio_url.lower().split('.')[-1] if '.' in master_audio_url.lower() else ''
@@ -293,7 +298,7 @@ def process_job_with_chunks(
             print(f"[worker] Converting audio from {audio_ext.upper()} to WAV format...")
             audio_wav_path = work_path / "audio_extracted.wav"
             subprocess.run(
-                ["ffmpeg", "-y", "-i", str(master_audio_raw_path), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_wav_path)],
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(master_audio_raw_path), "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_wav_path)],
                 check=True, capture_output=True
             )
             master_audio_raw_path = audio_wav_path
@@ -330,7 +335,7 @@ def process_job_with_chunks(
             # Trim video: apply -ss to video input, re-encode for frame-accurate cut
             video_trimmed_path = work_path / "video_trimmed.mp4"
             trim_result = subprocess.run(
-                ["ffmpeg", "-y", "-ss", str(sync_offset), "-i", str(user_video_raw_path),
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-ss", str(sync_offset), "-i", str(user_video_raw_path),
                  "-c:v", "libx264", "-preset", "fast", "-crf", "23",  # Re-encode for frame-accurate trim
                  "-pix_fmt", "yuv420p",  # Ensure compatibility
                  "-avoid_negative_ts", "make_zero",  # Ensure timestamps start at 0
@@ -361,7 +366,7 @@ def process_job_with_chunks(
             print(f"[worker] Negative offset: Trimming AUDIO by {trim_val:.3f}s (matching mid-song)")
             audio_trimmed_path = work_path / "audio_trimmed.wav"
             subprocess.run(
-                ["ffmpeg", "-y", "-ss", str(trim_val), "-i", str(master_audio_raw_path),
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-ss", str(trim_val), "-i", str(master_audio_raw_path),
                  "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le",
                  str(audio_trimmed_path)],
                 check=True, capture_output=True, text=True
@@ -409,12 +414,30 @@ def process_job_with_chunks(
         
         chunks_dir = work_path / "chunks"
         chunks_dir.mkdir(exist_ok=True)
-        final_segments = []
         
-        # Calculate estimated completion time (rough estimate: 60-90 seconds per chunk)
+        # Split all video chunks in one pass: a single decode/encode of the trimmed video with keyframes
+        # forced at every chunk boundary, cut by the segment muxer (instead of one ffmpeg per chunk,
+        # each decoding the video from the start up to its -ss)
+        # After Smart Video Trim, chunk 0 starts at 0, subsequent chunks continue sequentially
+        # IMPORTANT: Re-encode (not copy) to preserve quality and fix timestamps
+        print(f"[worker] Splitting video into {num_chunks} chunks of {chunk_duration:.3f}s (re-encoding for quality)")
+        subprocess.run(
+            ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-i", str(user_video_path),
+             "-c:v", "libx264", "-preset", "fast", "-crf", "23",  # Re-encode for quality
+             "-pix_fmt", "yuv420p",  # Ensure compatibility
+             "-force_key_frames", f"expr:gte(t,n_forced*{chunk_duration})",  # Frame-accurate cut points
+             "-f", "segment", "-segment_time", str(chunk_duration),
+             "-reset_timestamps", "1",  # Fix timestamps: every chunk starts at 0
+             "-segment_format_options", "movflags=+faststart",  # Web optimization
+             str(chunks_dir / "chunk_%03d.mp4")],
+            check=True, capture_output=True, text=True
+        )
+        
+        # Calculate estimated completion time (rough estimate: 60-90 seconds per chunk, up to
+        # CHUNK_WORKERS chunks in flight at once)
         import datetime
         estimated_seconds_per_chunk = 75  # Average processing time per chunk
-        estimated_total_seconds = num_chunks * estimated_seconds_per_chunk
+        estimated_total_seconds = ceil(num_chunks / CHUNK_WORKERS) * estimated_seconds_per_chunk
         estimated_completion = datetime.datetime.utcnow() + datetime.timedelta(seconds=estimated_total_seconds)
         
         # Update generation: set status to processing and estimated completion
@@ -426,23 +449,51 @@ def process_job_with_chunks(
                 "estimated_completion_at": estimated_completion.strftime("%Y-%m-%dT%H:%M:%SZ"),
             }).eq("id", generation_id).execute()
         
-        # Process each chunk
-        for i in range(num_chunks):
-            # Check if generation was cancelled before processing each chunk
-            if generation_id:
-                gen_check = supabase.table("generations").select("status").eq("id", generation_id).single().execute()
-                if gen_check.data and gen_check.data.get("status") == "cancelled":
-                    print(f"[worker] Generation {generation_id} was cancelled. Stopping chunk processing.")
-                    # Mark remaining chunks as failed
-                    for j in range(i, num_chunks):
-                        if chunk_records[j] and chunk_records[j].get("id"):
-                            supabase.table("video_chunks").update({
-                                "status": "FAILED",
-                                "error_message": "Cancelled by user",
-                            }).eq("id", chunk_records[j]["id"]).execute()
-                    raise Exception("Generation cancelled by user")
-            
+        # Chunks are independent once split: each one uploads, waits on Kling and muxes in its own
+        # thread, so wall time is ~the slowest chunk instead of the sum. Muxes are capped at one per CPU
+        # (single-threaded ffmpeg each) so a burst of finished chunks doesn't oversubscribe the box.
+        mux_workers = min(os.cpu_count() or 1, num_chunks)
+        mux_slots = threading.BoundedSemaphore(mux_workers)
+        mux_threads = "1" if mux_workers > 1 else "0"
+        cancelled = threading.Event()
+        progress_lock = threading.Lock()
+        chunks_done = [0]
+        
+        def watch_cancellation(stop: threading.Event):
+            """Re-read the generation row every CANCEL_CHECK_INTERVAL while chunks run. All chunks start
+            at once, so a cancel has to reach the ones already in flight, not just the next to start."""
+            while True:
+                try:
+                    gen_check = supabase.table("generations").select("status").eq("id", generation_id).single().execute()
+                    if gen_check.data and gen_check.data.get("status") == "cancelled":
+                        print(f"[worker] Generation {generation_id} was cancelled. Stopping chunk processing.")
+                        cancelled.set()
+                        return
+                except Exception as e:
+                    print(f"[worker] Cancellation check failed (will retry): {e}")
+                if stop.wait(CANCEL_CHECK_INTERVAL):
+                    return
+        
+        def check_cancelled():
+            # Raised into process_chunk's failure path, which marks the chunk FAILED with this message
+            if cancelled.is_set():
+                raise Exception("Cancelled by user")
+        
+        def process_chunk(i: int) -> Optional[Path]:
+            """Process chunk i end to end. Returns its muxed segment, or None if the chunk failed.
+            Cancellation is re-checked before each expensive step (upload, Kling submit, mux) and ends
+            the Kling wait early."""
             chunk_id = chunk_records[i]["id"] if chunk_records[i] else None
+            
+            if cancelled.is_set():
+                # Mark this (not yet started) chunk as failed
+                if chunk_id:
+                    supabase.table("video_chunks").update({
+                        "status": "FAILED",
+                        "error_message": "Cancelled by user",
+                    }).eq("id", chunk_id).execute()
+                return None
+            
             print(f"[worker] Processing chunk {i+1}/{num_chunks}...")
             
             try:
@@ -452,29 +503,8 @@ def process_job_with_chunks(
                         "status": "PROCESSING"
                     }).eq("id", chunk_id).execute()
                 
-                # Update generation progress: 10% (analysis) + 80% (chunks) + 10% (finalizing)
-                if generation_id:
-                    chunk_progress = 10 + int((i / num_chunks) * 80)
-                    supabase.table("generations").update({
-                        "progress_percentage": chunk_progress,
-                        "current_stage": "processing_chunks",
-                    }).eq("id", generation_id).execute()
-                
-                # Split video chunk
-                # After Smart Video Trim, chunk 0 starts at 0, subsequent chunks continue sequentially
-                # IMPORTANT: Re-encode (not copy) to preserve quality and fix timestamps
-                start_time = i * chunk_duration
+                # Video chunk (cut by the single split pass above)
                 chunk_path = chunks_dir / f"chunk_{i:03d}.mp4"
-                print(f"[worker] Extracting chunk {i+1} video: start={start_time:.3f}s, duration={chunk_duration:.3f}s (re-encoding for quality)")
-                subprocess.run(
-                    ["ffmpeg", "-y", "-i", str(user_video_path), "-ss", str(start_time), "-t", str(chunk_duration),
-                     "-c:v", "libx264", "-preset", "fast", "-crf", "23",  # Re-encode for quality
-                     "-pix_fmt", "yuv420p",  # Ensure compatibility
-                     "-avoid_negative_ts", "make_zero",  # Fix timestamps
-                     "-movflags", "+faststart",  # Web optimization
-                     str(chunk_path)],
-                    check=True, capture_output=True, text=True
-                )
                 # Verify chunk was created and has video stream
                 if not chunk_path.exists() or chunk_path.stat().st_size == 0:
                     raise Exception(f"Video chunk {i+1} extraction failed - file missing or empty")
@@ -488,14 +518,12 @@ def process_job_with_chunks(
                 print(f"[worker] Video chunk {i+1} extracted: {chunk_path.stat().st_size / 1024:.2f} KB")
                 
                 # Upload chunk for Kling
+                check_cancelled()
                 chunk_storage_path = f"temp_chunks/{job_id}/chunk_{i:03d}.mp4"
                 with open(chunk_path, "rb") as f:
-                    supabase.storage.from_("vannilli").upload(chunk_storage_path, f.read(), file_options={"content-type": "video/mp4"})
+                    supabase.storage.from_("vannilli").upload(chunk_storage_path, f, file_options={"content-type": "video/mp4"})
                 
-                signed_url_result = supabase.storage.from_("vannilli").create_signed_url(chunk_storage_path, 3600)
-                if isinstance(signed_url_result, tuple):
-                    signed_url_result = signed_url_result[0] if signed_url_result else {}
-                chunk_url = (signed_url_result.get("signedUrl") or signed_url_result.get("signed_url")) if isinstance(signed_url_result, dict) else None
+                chunk_url = signed_url(supabase.storage.from_("vannilli").create_signed_url(chunk_storage_path, 3600))
                 
                 if not chunk_url:
                     raise Exception(f"Failed to create signed URL for chunk {i+1}")
@@ -540,6 +568,7 @@ def process_job_with_chunks(
                 # Construct webhook URL for fal.ai callbacks
                 webhook_url = f"{supabase_url}/functions/v1/fal-webhook"
                 print(f"[worker] Submitting chunk {i+1} to fal.ai with webhook: {webhook_url[:60]}...")
+                check_cancelled()
                 task_id = kling_client.generate(chunk_url, current_image, prompt, webhook_url=webhook_url)
                 kling_completed_at = None
                 
@@ -591,8 +620,9 @@ def process_job_with_chunks(
                 # If webhook didn't provide URL yet, poll fal.ai
                 if not kling_video_url:
                     print(f"[worker] Webhook hasn't updated chunk {i+1} yet, polling fal.ai (request_id: {task_id})...")
-                    status, kling_video_url = kling_client.poll_status(task_id)
+                    status, kling_video_url = kling_client.poll_status(task_id, cancelled=cancelled)
                     kling_completed_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+                    check_cancelled()
                     
                     if status != "succeed" or not kling_video_url:
                         raise Exception(f"Kling generation failed for chunk {i+1}")
@@ -618,45 +648,45 @@ def process_job_with_chunks(
                 print(f"  - Requested at: {kling_requested_at}")
                 print(f"  - Completed at: {kling_completed_at}")
                 
-                # Download Kling output
-                kling_output_path = chunks_dir / f"kling_chunk_{i:03d}.mp4"
-                r = requests.get(kling_video_url, timeout=120)
-                r.raise_for_status()
-                kling_output_path.write_bytes(r.content)
+                # Kling output is only read once, by the mux below: ffmpeg pulls it from the URL
+                # (HTTP range reads) instead of it being written to disk and read straight back
                 
                 # DO NOT trim chunk 0 video - keep dead space
                 # We'll delay chunk 0 audio by sync_offset when muxing instead
                 
-                # Extract audio slice (audio_start_time and audio_duration already calculated above)
-                audio_slice_path = chunks_dir / f"audio_chunk_{i:03d}.wav"
-                print(f"[worker] Extracting audio slice {i+1}: start={audio_start_time:.3f}s, duration={audio_duration:.3f}s from master audio")
-                subprocess.run(
-                    ["ffmpeg", "-y", "-i", str(master_audio_path), "-ss", str(audio_start_time), "-t", str(audio_duration),
-                     "-ac", "2", "-ar", "44100", "-c:a", "pcm_s16le", str(audio_slice_path)],
-                    check=True, capture_output=True
-                )
-                # Verify audio slice was created
-                if not audio_slice_path.exists() or audio_slice_path.stat().st_size == 0:
-                    raise Exception(f"Audio slice {i+1} extraction failed - file missing or empty")
-                print(f"[worker] Audio slice {i+1} extracted: {audio_slice_path.stat().st_size / 1024:.2f} KB")
-                
-                # Mux video + audio
+                # Mux video + audio slice in one ffmpeg pass: the slice (audio_start_time and audio_duration
+                # already calculated above) is cut on the master audio input itself, with -ss before -i
+                # seeking the WAV, so there is no separate extract process or intermediate slice WAV
                 # After Smart Video Trim, chunk 0 video/audio both start at 0
                 # Subsequent chunks continue sequentially, no delay needed
+                check_cancelled()
                 segment_path = chunks_dir / f"segment_{i:03d}.mp4"
-                print(f"[worker] Muxing chunk {i+1}: Kling video + audio slice")
+                print(f"[worker] Muxing chunk {i+1}: Kling video + audio slice start={audio_start_time:.3f}s, duration={audio_duration:.3f}s from master audio")
                 # Simple muxing - both video and audio are already aligned after Smart Video Trim
-                result = subprocess.run(
-                    ["ffmpeg", "-y",
-                     "-i", str(kling_output_path),  # Video from Kling
-                     "-i", str(audio_slice_path),   # Audio slice (aligned after Smart Video Trim)
-                     "-map", "0:v:0", "-map", "1:a:0",
-                     "-c:v", "libx264", "-preset", "veryfast",
-                     "-pix_fmt", "yuv420p", "-c:a", "aac", "-b:a", "192k",
-                     "-movflags", "+faststart",
-                     "-shortest", str(segment_path)],
-                    check=True, capture_output=True, text=True
-                )
+                def mux(video_args):
+                    return subprocess.run(
+                        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y",
+                         "-reconnect", "1", "-reconnect_streamed", "1",
+                         "-i", kling_video_url,  # Video from Kling
+                         "-ss", str(audio_start_time), "-t", str(audio_duration),
+                         "-i", str(master_audio_path),  # Audio slice (aligned after Smart Video Trim)
+                         "-map", "0:v:0", "-map", "1:a:0",
+                         "-threads", mux_threads,
+                         *video_args, "-c:a", "aac", "-b:a", "192k",
+                         "-movflags", "+faststart",
+                         "-shortest", str(segment_path)],
+                        check=True, capture_output=True, text=True
+                    )
+                # Stream-copy Kling's video when it is already H.264/yuv420p (nothing touches the pixels)
+                video_args = mux_video_args(kling_video_url)
+                with mux_slots:
+                    try:
+                        result = mux(video_args)
+                    except subprocess.CalledProcessError as mux_error:
+                        if video_args[-1] != "copy":
+                            raise
+                        print(f"[worker] Stream-copy mux failed for chunk {i+1}, re-encoding: {(mux_error.stderr or '')[-500:]}")
+                        result = mux([*h264_encode_args(), "-pix_fmt", "yuv420p"])  # NVENC on GPU containers
                 # Log FFmpeg output for debugging
                 if result.stdout:
                     print(f"[worker] FFmpeg output: {result.stdout[:500]}")
@@ -674,19 +704,15 @@ def process_job_with_chunks(
                 chunk_output_key = f"{OUTPUTS_PREFIX}/{generation_id or job_id}/chunk_{i:03d}.mp4"
                 print(f"[worker] Uploading muxed chunk {i+1} to Supabase: {chunk_output_key}")
                 with open(segment_path, "rb") as f:
-                    supabase.storage.from_(BUCKET).upload(chunk_output_key, f.read(), file_options={"content-type": "video/mp4"})
+                    supabase.storage.from_(BUCKET).upload(chunk_output_key, f, file_options={"content-type": "video/mp4"})
                 print(f"[worker] Chunk {i+1} uploaded successfully to Supabase Storage")
                 
                 # Create signed URL for the muxed video (NOT the Kling URL)
                 # This is the final processed video with audio aligned by VANNILLI's engine
-                signed_chunk_url = supabase.storage.from_(BUCKET).create_signed_url(chunk_output_key, 3600)
-                if isinstance(signed_chunk_url, tuple):
-                    signed_chunk_url = signed_chunk_url[0] if signed_chunk_url else {}
-                chunk_video_url = (signed_chunk_url.get("signedUrl") or signed_chunk_url.get("signed_url")) if isinstance(signed_chunk_url, dict) else None
+                chunk_video_url = signed_url(supabase.storage.from_(BUCKET).create_signed_url(chunk_output_key, 3600))
                 
                 if not chunk_video_url:
                     # Fallback: construct public URL if signed URL creation fails
-                    supabase_url = os.environ.get("SUPABASE_URL", "").rstrip("/")
                     chunk_video_url = f"{supabase_url}/storage/v1/object/public/{BUCKET}/{chunk_output_key}"
                 
                 print(f"[worker] Chunk {i+1} final video URL (muxed with audio): {chunk_video_url[:80]}...")
@@ -734,17 +760,19 @@ def process_job_with_chunks(
                             # If even minimal update fails, log but continue
                             print(f"[worker] ERROR: Could not update chunk {i+1} status in database")
                 
-                final_segments.append(segment_path)
-                
-                # Update generation progress after chunk completion
+                # Update generation progress after chunk completion:
+                # 10% (analysis) + 80% (chunks, by how many have finished) + 10% (finalizing)
                 if generation_id:
-                    chunk_progress = 10 + int(((i + 1) / num_chunks) * 80)
-                    supabase.table("generations").update({
-                        "progress_percentage": chunk_progress,
-                        "current_stage": "processing_chunks",
-                    }).eq("id", generation_id).execute()
+                    with progress_lock:
+                        chunks_done[0] += 1
+                        chunk_progress = 10 + int((chunks_done[0] / num_chunks) * 80)
+                        supabase.table("generations").update({
+                            "progress_percentage": chunk_progress,
+                            "current_stage": "processing_chunks",
+                        }).eq("id", generation_id).execute()
                 
                 print(f"[worker] Chunk {i+1}/{num_chunks} completed successfully")
+                return segment_path
                 
             except Exception as e:
                 error_msg = str(e)[:500]
@@ -803,8 +831,21 @@ def process_job_with_chunks(
                             "status": "FAILED",
                             "error_message": error_msg,
                         }).eq("id", chunk_id).execute()
-                # Continue processing other chunks
-                continue
+                # Other chunks carry on
+                return None
+        
+        stop_watching = threading.Event()
+        if generation_id:
+            threading.Thread(target=watch_cancellation, args=(stop_watching,), daemon=True).start()
+        try:
+            with ThreadPoolExecutor(max_workers=min(num_chunks, CHUNK_WORKERS)) as pool:
+                segments = list(pool.map(process_chunk, range(num_chunks)))
+        finally:
+            stop_watching.set()
+        if cancelled.is_set():
+            raise Exception("Generation cancelled by user")
+        # Successful chunks, in chunk order
+        final_segments = [seg for seg in segments if seg is not None]
         
         # Stitch all successful chunks
         if len(final_segments) == 0:
@@ -845,9 +886,10 @@ def process_job_with_chunks(
                     f.write(f"file '{seg.absolute()}'\n")
             
             final_path = work_path / "final.mp4"
+            # Stream-copied only when every chunk's video matches chunk 0 (one avcC per MP4 track)
             subprocess.run(
-                ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", str(concat_file),
-                 "-c", "copy", str(final_path)],
+                ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y", "-f", "concat", "-safe", "0", "-i", str(concat_file),
+                 *concat_video_args(final_segments), "-c:a", "copy", str(final_path)],
                 check=True, capture_output=True
             )
         else:
@@ -868,16 +910,15 @@ def process_job_with_chunks(
         
         print(f"[worker] Final video created: {final_path}, size: {final_path.stat().st_size / 1024 / 1024:.2f} MB")
         
-        # IMPORTANT: Read file contents into memory before temp directory is deleted
+        # IMPORTANT: Move the file out before temp directory is deleted
         # The temp directory will be cleaned up when this function returns
-        final_video_bytes = final_path.read_bytes()
-        print(f"[worker] Final video loaded into memory: {len(final_video_bytes) / 1024 / 1024:.2f} MB")
-        
-        # Create a temporary file in a persistent location (outside temp directory)
+        # Create a temporary file in a persistent location (outside temp directory) and move the
+        # final video onto it: a rename on the same filesystem, no copy through Python memory
+        import shutil
         import tempfile as tf
         persistent_temp = tf.NamedTemporaryFile(delete=False, suffix='.mp4')
-        persistent_temp.write(final_video_bytes)
         persistent_temp.close()
+        shutil.move(str(final_path), persistent_temp.name)
         persistent_final_path = Path(persistent_temp.name)
         
         print(f"[worker] Final video saved to persistent location: {persistent_final_path}")
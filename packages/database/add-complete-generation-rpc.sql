@@ -0,0 +1,38 @@
+-- ============================================================================
+-- COMPLETE GENERATION IN ONE CALL
+-- ============================================================================
+-- Used by the Modal process_video worker when the final video is uploaded.
+-- Marks the generation completed and its project (if any) completed in a
+-- single round-trip instead of update + select + update from the client.
+
+CREATE OR REPLACE FUNCTION complete_generation(generation_uuid UUID, output_path TEXT)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+DECLARE
+  gen_project_id UUID;
+BEGIN
+  UPDATE generations
+  SET
+    status = 'completed',
+    final_video_r2_path = output_path,
+    completed_at = NOW()
+  WHERE id = generation_uuid
+  RETURNING project_id INTO gen_project_id;
+
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Generation not found';
+  END IF;
+
+  IF gen_project_id IS NOT NULL THEN
+    UPDATE projects
+    SET status = 'completed'
+    WHERE id = gen_project_id;
+  END IF;
+
+  RETURN TRUE;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION complete_generation(UUID, TEXT) TO service_role;
@@ -0,0 +1,46 @@
+-- ============================================================================
+-- RECORD MEDIA ANALYSIS IN ONE CALL
+-- ============================================================================
+-- Used by the Modal media_analyzer when analysis finishes.
+-- Stores the analysis on the video job and moves its generation (if any) to
+-- 10% / analyzing in a single round-trip and transaction, instead of two
+-- separate table updates from the client.
+
+CREATE OR REPLACE FUNCTION record_analysis(
+  job_uuid UUID,
+  generation_uuid UUID,
+  job_sync_offset FLOAT,
+  job_bpm FLOAT,
+  job_chunk_duration FLOAT
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+AS $$
+BEGIN
+  UPDATE video_jobs
+  SET
+    sync_offset = job_sync_offset,
+    bpm = job_bpm,
+    chunk_duration = job_chunk_duration,
+    analysis_status = 'ANALYZED',
+    status = 'ANALYZED'
+  WHERE id = job_uuid;
+
+  IF NOT FOUND THEN
+    RAISE EXCEPTION 'Video job not found';
+  END IF;
+
+  IF generation_uuid IS NOT NULL THEN
+    UPDATE generations
+    SET
+      progress_percentage = 10,
+      current_stage = 'analyzing'
+    WHERE id = generation_uuid;
+  END IF;
+
+  RETURN TRUE;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION record_analysis(UUID, UUID, FLOAT, FLOAT, FLOAT) TO service_role;